@@ -0,0 +1,61 @@
+"""
+测量 `import usb_hid_toolkit` 的启动开销，并检查导入时没有带入重量级模块。
+
+用法：
+    python benchmarks/import_time.py                 # 默认运行 20 次
+    python benchmarks/import_time.py --budget-ms 5   # 超出预算时以非零状态退出
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 导入包时不应被加载的模块
+FORBIDDEN_MODULES = ['asyncio', 'termios', 'numpy', 'serial', 'socket']
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SRC_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of usb_hid_toolkit")
+    parser.add_argument("--runs", type=int, default=20, help="Number of interpreter launches per measurement")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the import overhead exceeds this")
+    args = parser.parse_args()
+
+    baseline = [run_python("pass")[0] for _ in range(args.runs)]
+    with_import = [run_python("import usb_hid_toolkit")[0] for _ in range(args.runs)]
+    overhead_ms = (statistics.median(with_import) - statistics.median(baseline)) * 1000
+
+    _, loaded = run_python(
+        "import sys; before = set(sys.modules); import usb_hid_toolkit; "
+        "print('\\n'.join(sorted(set(sys.modules) - before)))"
+    )
+    loaded = loaded.split()
+    forbidden = [m for m in FORBIDDEN_MODULES if m in loaded]
+
+    print(f"interpreter startup: {statistics.median(baseline) * 1000:.2f} ms (median of {args.runs})")
+    print(f"import overhead:     {overhead_ms:.2f} ms")
+    print(f"modules loaded:      {', '.join(loaded) or '-'}")
+
+    failed = False
+    if forbidden:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(forbidden)}")
+        failed = True
+    if args.budget_ms is not None and overhead_ms > args.budget_ms:
+        print(f"FAIL: import overhead {overhead_ms:.2f} ms exceeds budget {args.budget_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
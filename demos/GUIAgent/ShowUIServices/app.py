@@ -1,15 +1,26 @@
 import os
+import asyncio
 import torch
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Union, Dict, Any
 import base64
+import hashlib
 from io import BytesIO
 from PIL import Image
-from transformers import Qwen2VLForConditionalGeneration, AutoTokenizer, AutoProcessor
+from transformers import Qwen2VLForConditionalGeneration, AutoTokenizer, AutoProcessor, StoppingCriteria, StoppingCriteriaList, LogitsProcessorList
 from qwen_vl_utils import process_vision_info
 import time
 import uuid
+import queue
+import threading
+import traceback
+from batching import MicroBatcher
+import constrained
+import cpu_mode
+from prefix_cache import PrefixCache
+from vision_cache import ByteLRU, VisionEmbeddingCache, tensor_bytes
 
 app = FastAPI(title="ShowUI-2B OpenAI Compatible API")
 
@@ -21,24 +32,96 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 
 # Set max pixels to avoid OOM for large screenshots
 # ShowUI-2B/Qwen2-VL specific configuration
+# Smaller profiles trade some grounding precision for much faster CPU inference;
+# keep the agent's LAYOUT_MAX_PIXELS in line with the value used here
+PIXEL_PROFILES = {"full": 1344, "small": 768, "tiny": 512}
 min_pixels = 256 * 28 * 28
-max_pixels = 1344 * 28 * 28
-
-print(f"Loading model {MODEL_ID} to {device} (Cache: {LOCAL_MODEL_PATH})...")
-model = Qwen2VLForConditionalGeneration.from_pretrained(
-    MODEL_ID,
-    torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
-    device_map="auto",
-    trust_remote_code=True,
-    cache_dir=LOCAL_MODEL_PATH
-)
-processor = AutoProcessor.from_pretrained(
-    MODEL_ID, 
-    min_pixels=min_pixels, 
-    max_pixels=max_pixels,
-    cache_dir=LOCAL_MODEL_PATH
-)
-print("Model loaded successfully.")
+max_pixels = int(os.getenv("SHOWUI_MAX_PIXELS", "0")) or PIXEL_PROFILES[os.getenv("SHOWUI_PIXEL_PROFILE", "full")] * 28 * 28
+
+if device == "cpu":
+    # At import, before the loader thread or any torch op starts the thread pools
+    cpu_mode.configure_threads()
+    precision = cpu_mode.cpu_precision()
+    torch_dtype = cpu_mode.load_dtype(precision)
+else:
+    precision = "bf16"
+    torch_dtype = torch.bfloat16
+
+# Run one small inference before reporting ready
+WARMUP = os.getenv("SHOWUI_WARMUP", "1") == "1"
+
+# Set by load_model(): in the background at startup, or by run.py before forking workers
+model = None
+processor = None
+embedding_cache = None
+rope_owner = None
+status = "starting"  # starting -> loading -> warming_up -> ready, or failed
+_load_lock = threading.Lock()
+
+
+def load_model():
+    """Load the weights and processor once; later calls return immediately."""
+    global model, processor, embedding_cache, rope_owner, status
+    with _load_lock:
+        if model is not None:
+            return
+        status = "loading"
+        print(f"Loading model {MODEL_ID} to {device} ({precision}, max_pixels={max_pixels}, Cache: {LOCAL_MODEL_PATH})...")
+        loaded = Qwen2VLForConditionalGeneration.from_pretrained(
+            MODEL_ID,
+            torch_dtype=torch_dtype,
+            device_map="auto",
+            trust_remote_code=True,
+            cache_dir=LOCAL_MODEL_PATH
+        )
+        if device == "cpu":
+            cpu_mode.optimize(loaded, precision)
+        processor = AutoProcessor.from_pretrained(
+            MODEL_ID, 
+            min_pixels=min_pixels, 
+            max_pixels=max_pixels,
+            cache_dir=LOCAL_MODEL_PATH
+        )
+        processor.tokenizer.padding_side = "left"
+        if EMBED_CACHE_MB > 0:
+            embedding_cache = VisionEmbeddingCache(loaded.visual, int(EMBED_CACHE_MB * 1024 * 1024))
+        # rope_deltas lives on the inner model in newer transformers versions
+        rope_owner = loaded.model if hasattr(getattr(loaded, "model", None), "rope_deltas") else loaded
+        model = loaded
+        print("Model loaded successfully.")
+
+
+def warm_up():
+    """One small constrained inference: kernel setup and the grammar build happen before the first real request."""
+    image = Image.new("RGB", (448, 448), "white")
+    messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": "Find: OK button"}]}]
+    result = run_batch([InferenceJob(messages, image, "warm-up", 8, constrained=True)])[0]
+    if isinstance(result, Exception):
+        raise result
+
+
+def initialize():
+    """Load the model (unless preloaded), start the inference thread and warm up."""
+    global status
+    try:
+        load_model()
+        batcher.start()
+        if WARMUP:
+            status = "warming_up"
+            start = time.time()
+            warm_up()
+            print(f"[ShowUI API] Warm-up inference done in {time.time() - start:.2f}s")
+        status = "ready"
+    except Exception as e:
+        status = "failed"
+        print(f"[ShowUI API] Initialization failed: {e}")
+        traceback.print_exc()
+
+
+@app.on_event("startup")
+async def start_initialization():
+    # Load in the background so /health and /ready answer while the weights load
+    threading.Thread(target=initialize, name="showui-init", daemon=True).start()
 
 class ChatMessage(BaseModel):
     role: str
@@ -50,13 +133,16 @@ class ChatCompletionRequest(BaseModel):
     stream: Optional[bool] = False
     max_tokens: Optional[int] = 1024
     temperature: Optional[float] = 0.7
+    # Grounding fast path: only allow {"point": [x, y]} / {"bbox_2d": [...]} and stop at the closing brace
+    constrained: Optional[bool] = False
 
-def decode_image(image_data: str) -> Image.Image:
+def decode_image(image_data: str):
+    """Return the (lazily decoded) image and a content hash of its bytes."""
     if image_data.startswith("data:image"):
         image_data = image_data.split(",")[1]
     
     img_bytes = base64.b64decode(image_data)
-    return Image.open(BytesIO(img_bytes))
+    return Image.open(BytesIO(img_bytes)), hashlib.sha1(img_bytes).hexdigest()
 
 @app.get("/v1/models")
 async def list_models():
@@ -72,16 +158,11 @@ async def list_models():
         ]
     }
 
-@app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
-    # Extract images and text from messages
-    # ShowUI-2B is usually used with a single image + query
-    start_time = time.time()
-    print(f"\n[ShowUI API] Received request for model: {request.model}")
-    
+def build_job(request: ChatCompletionRequest):
+    """Convert an OpenAI-style request into a single-image Qwen2-VL inference job."""
     text_query = ""
     images = []
-    
+
     for message in request.messages:
         if isinstance(message.content, str):
             if message.role == "user":
@@ -104,83 +185,301 @@ async def chat_completions(request: ChatCompletionRequest):
 
     print(f"[ShowUI API] Processing query: \"{text_query.strip()[:50]}...\" with {len(images)} image(s)")
 
-    # Prepare inputs for Qwen2-VL
-    # Based on transformers documentation for Qwen2-VL
-    
+    image, key = images[-1] # Use the last image
     messages = [
         {
             "role": "user",
             "content": [
-                {"type": "image", "image": images[-1]}, # Use the last image
+                {"type": "image"},
                 {"type": "text", "text": text_query.strip()},
             ],
         }
     ]
+    max_tokens = request.max_tokens or 1024
+    if request.constrained:
+        max_tokens = min(max_tokens, constrained.MAX_NEW_TOKENS)
+    return InferenceJob(messages, image, key, max_tokens, bool(request.constrained))
 
-    # Preparation for inference
-    print(f"[ShowUI API] Image count: {len(images)}, Image size: {images[-1].size if images else 'N/A'}")
-    print(f"[ShowUI API] Text query length: {len(text_query.strip())}")
-    print("[ShowUI API] Preparing vision-language inputs...")
-    
-    # ShowUI-2B/Qwen2-VL specific: Use the standard template
-    text = processor.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
-    )
-    print(f"[ShowUI API] Template text length: {len(text)}")
-    
-    image_inputs, video_inputs = process_vision_info(messages)
-    
-    print(f"[ShowUI API] image_inputs type: {type(image_inputs)}, length: {len(image_inputs) if isinstance(image_inputs, list) else 'N/A'}")
-    if image_inputs:
-        print(f"[ShowUI API] First image tensor shape: {image_inputs[0].shape if hasattr(image_inputs[0], 'shape') else 'N/A'}")
-    else:
-        print("[ShowUI API] WARNING: image_inputs is EMPTY!")
-
-    inputs = processor(
-        text=[text],
-        images=image_inputs,
-        videos=video_inputs,
-        padding=True,
-        return_tensors="pt",
-    )
-    print(f"[ShowUI API] Processed inputs keys: {inputs.keys()}")
-    print(f"[ShowUI API] Input shape info - input_ids: {inputs.input_ids.shape}, pixel_values: {inputs.get('pixel_values', {}).shape if 'pixel_values' in inputs else 'N/A'}")
-    
-    inputs = inputs.to(device)
 
-    # Inference
-    print(f"[ShowUI API] Starting model inference on {device} (Input tokens: {inputs.input_ids.shape[1]})...")
+class InferenceJob:
+    """One queued request; `cancelled` is set when the client goes away."""
+    __slots__ = ("messages", "image", "image_key", "max_tokens", "constrained", "cancelled")
+
+    def __init__(self, messages, image, image_key, max_tokens, constrained=False):
+        self.messages = messages
+        self.image = image
+        self.image_key = image_key
+        self.max_tokens = max_tokens
+        self.constrained = constrained
+        self.cancelled = threading.Event()
+
+
+class StopCancelled(StoppingCriteria):
+    """Stops decoding rows whose client has disconnected."""
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([job.cancelled.is_set() for job in self.jobs], dtype=torch.bool, device=input_ids.device)
+
+
+def vision_inputs(job):
+    """pixel_values and image_grid_thw for the job's image, cached by content hash."""
+    cached = vision_cache.get(job.image_key)
+    if cached is None:
+        image_inputs, _ = process_vision_info([{"role": "user", "content": [{"type": "image", "image": job.image}]}])
+        features = processor.image_processor(images=image_inputs, return_tensors="pt")
+        cached = (features["pixel_values"], features["image_grid_thw"])
+        vision_cache.put(job.image_key, cached, tensor_bytes(*cached))
+    return cached
+
+
+def build_inputs(jobs):
+    """
+    Tokenize a batch the way the processor does, but with preprocessed pixels from
+    the vision cache: each image placeholder expands to one token per merged patch.
+    """
+    merge_length = processor.image_processor.merge_size ** 2
+    image_token = getattr(processor, "image_token", "<|image_pad|>")
+    texts, pixel_values, grids = [], [], []
+    for job in jobs:
+        pixels, grid = vision_inputs(job)
+        # ShowUI-2B/Qwen2-VL specific: Use the standard template
+        text = processor.apply_chat_template(job.messages, tokenize=False, add_generation_prompt=True)
+        texts.append(text.replace(image_token, image_token * int(grid.prod() // merge_length), 1))
+        pixel_values.append(pixels)
+        grids.append(grid)
+
+    # Left padding keeps every prompt adjacent to its generated tokens
+    inputs = processor.tokenizer(texts, padding=True, return_tensors="pt")
+    inputs["pixel_values"] = torch.cat(pixel_values)
+    inputs["image_grid_thw"] = torch.cat(grids)
+    return inputs.to(device)
+
+
+def run_batch(jobs):
+    """
+    Run one padded generate over a batch of InferenceJobs and return the decoded
+    output text for each job, in order. A job whose image cannot be processed gets
+    its exception as result instead of failing the whole batch.
+    """
+    results = [None] * len(jobs)
+    for i, job in enumerate(jobs):
+        try:
+            vision_inputs(job)
+        except Exception as e:
+            results[i] = e
+    indices = [i for i, result in enumerate(results) if result is None]
+    if not indices:
+        return results
+    jobs = [jobs[i] for i in indices]
+
+    inputs = build_inputs(jobs)
+
+    print(f"[ShowUI API] Starting batched inference on {device} (batch: {len(jobs)}, input_ids: {tuple(inputs.input_ids.shape)})...")
     inference_start = time.time()
+    generate_kwargs = dict(
+        max_new_tokens=max(job.max_tokens for job in jobs),
+        do_sample=False,
+        stopping_criteria=StoppingCriteriaList([StopCancelled(jobs)]),
+    )
+    processors = []
+    if not all(job.constrained for job in jobs):
+        # 添加一些生成参数以防过早停止 (repetition_penalty 1.1, only on the unconstrained rows)
+        processors.append(constrained.RowRepetitionPenalty(1.1, [not job.constrained for job in jobs]))
+    if any(job.constrained for job in jobs):
+        processors.append(constrained.GroundingLogitsProcessor(grounding_grammar(), [job.constrained for job in jobs]))
+    generate_kwargs["logits_processor"] = LogitsProcessorList(processors)
     with torch.no_grad():
-        generated_ids = model.generate(
-            **inputs, 
-            max_new_tokens=request.max_tokens,
-            # 添加一些生成参数以防过早停止
-            repetition_penalty=1.1,
-            do_sample=False
-        )
-        
-        input_len = inputs.input_ids.shape[1]
-        generated_ids_trimmed = [
-            out_ids[input_len:] for out_ids in generated_ids
-        ]
-        
-        print(f"[ShowUI API] Generated tokens count: {len(generated_ids_trimmed[0])}")
-        
-        output_text = processor.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )[0]
-    
-    inference_duration = time.time() - inference_start
-    total_duration = time.time() - start_time
-    
-    print(f"[ShowUI API] Inference complete in {inference_duration:.2f}s")
+        if prefix_cache is not None:
+            new_ids = generate_with_prefix(jobs, inputs, generate_kwargs)
+        else:
+            if embedding_cache is not None:
+                embedding_cache.pending_keys = [job.image_key for job in jobs]
+            new_ids = model.generate(**inputs, **generate_kwargs)[:, inputs.input_ids.shape[1]:]
+
+    # Cut each row to its own token budget
+    generated_ids_trimmed = [ids[:job.max_tokens] for ids, job in zip(new_ids, jobs)]
+    outputs = processor.batch_decode(
+        generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+    )
+    print(f"[ShowUI API] Batch of {len(jobs)} complete in {time.time() - inference_start:.2f}s")
+    for i, output in zip(indices, outputs):
+        results[i] = output
+    return results
+
+
+def generate_with_prefix(jobs, inputs, generate_kwargs):
+    """
+    Generate for a batch whose jobs all query the same image, starting from the cached
+    prompt KV of that image when every prompt shares its image tokens, and refresh the
+    cache otherwise. Returns only the newly generated token ids of each row.
+    Batches that mix images run a plain generate. Any failure on the cached path falls
+    back to a full prefill.
+    """
+    key = jobs[0].image_key
+    if any(job.image_key != key for job in jobs):
+        if embedding_cache is not None:
+            embedding_cache.pending_keys = [job.image_key for job in jobs]
+        return model.generate(**inputs, **generate_kwargs)[:, inputs.input_ids.shape[1]:]
+
+    # Prompts without their left padding
+    rows = [ids[mask.bool()] for ids, mask in zip(inputs.input_ids, inputs.attention_mask)]
+    image_positions = (rows[0] == model.config.image_token_id).nonzero()
+    min_length = int(image_positions.max()) + 1 if len(image_positions) else len(rows[0])
+
+    hit = prefix_cache.lookup(key, rows, min_length)
+    if hit is not None:
+        cache, rope_deltas, length = hit
+        print(f"[ShowUI API] Reusing {length} prompt tokens from the prefix cache for {len(rows)} row(s)")
+        try:
+            input_ids, attention_mask, pads = prefixed_batch(rows, length, inputs.attention_mask.dtype)
+            if len(rows) > 1:
+                cache.batch_repeat_interleave(len(rows))
+            # Decoding after the image uses rope position = cache position + rope_deltas. The padding
+            # sits between the shared prefix and each query, so each row's delta is lowered by its
+            # padding to keep the query at the positions it has in an unpadded prompt.
+            rope_owner.rope_deltas = rope_deltas.repeat(len(rows), 1) - torch.tensor(pads, device=rope_deltas.device).unsqueeze(1)
+            output = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                    past_key_values=cache, **generate_kwargs)
+            return output[:, input_ids.shape[1]:]
+        except Exception as e:
+            print(f"[ShowUI API] Prefix cache path failed ({e}), running full prefill")
+
+    if embedding_cache is not None:
+        embedding_cache.pending_keys = [job.image_key for job in jobs]
+    output = model.generate(**inputs, return_dict_in_generate=True, **generate_kwargs)
+    try:
+        # The longest prompt has no left padding: its KV is the one an unbatched prefill produces
+        row = max(range(len(rows)), key=lambda i: len(rows[i]))
+        cache = output.past_key_values
+        if len(rows) > 1:
+            cache.batch_select_indices(torch.tensor([row], device=inputs.input_ids.device))
+        prefix_cache.store(key, rows[row], cache, rope_owner.rope_deltas[row:row + 1])
+    except Exception as e:
+        print(f"[ShowUI API] Could not store prefix cache: {e}")
+    return output.sequences[:, inputs.input_ids.shape[1]:]
+
+
+def prefixed_batch(rows, length, mask_dtype):
+    """
+    Batch of `rows` that share their first `length` tokens: the shared prefix first,
+    then padding, then each row's remaining tokens. Returns (input_ids, attention_mask, pads).
+    """
+    pad_id = processor.tokenizer.pad_token_id
+    suffixes = [row[length:] for row in rows]
+    width = max(len(suffix) for suffix in suffixes)
+    pads = [width - len(suffix) for suffix in suffixes]
+    prefix = rows[0][:length]
+    input_ids = torch.stack([torch.cat([prefix, prefix.new_full((pad,), pad_id), suffix])
+                             for suffix, pad in zip(suffixes, pads)])
+    attention_mask = torch.stack([torch.cat([
+        torch.ones(length, dtype=mask_dtype, device=prefix.device),
+        torch.zeros(pad, dtype=mask_dtype, device=prefix.device),
+        torch.ones(len(suffix), dtype=mask_dtype, device=prefix.device),
+    ]) for suffix, pad in zip(suffixes, pads)])
+    return input_ids, attention_mask, pads
+
+
+_grammar = None
+
+
+def grounding_grammar():
+    """Built on first use: decoding the vocabulary takes a moment."""
+    global _grammar
+    if _grammar is None:
+        eos = model.generation_config.eos_token_id
+        _grammar = constrained.GroundingGrammar(processor.tokenizer, eos if isinstance(eos, list) else [eos])
+    return _grammar
+
+
+# Screenshots are usually sent once per element query: cache the preprocessed pixels
+# (and, optionally, the vision tower output) by image content hash
+vision_cache = ByteLRU(int(float(os.getenv("SHOWUI_VISION_CACHE_MB", "512")) * 1024 * 1024))
+EMBED_CACHE_MB = float(os.getenv("SHOWUI_EMBED_CACHE_MB", "256"))
+
+# Prompt KV caches of the most recent screenshots, reused by batches that query one screenshot
+PREFIX_CACHE_SIZE = int(os.getenv("SHOWUI_PREFIX_CACHE", "4"))
+prefix_cache = PrefixCache(PREFIX_CACHE_SIZE) if PREFIX_CACHE_SIZE > 0 else None
+
+
+# Concurrent requests are collected for a few milliseconds and decoded together
+MAX_BATCH_SIZE = int(os.getenv("SHOWUI_MAX_BATCH_SIZE", "4"))
+BATCH_WAIT_MS = float(os.getenv("SHOWUI_BATCH_WAIT_MS", "10"))
+# Requests beyond this many waiting are rejected with 429 instead of piling up
+MAX_QUEUE = int(os.getenv("SHOWUI_MAX_QUEUE", "32"))
+
+batcher = MicroBatcher(run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=BATCH_WAIT_MS / 1000,
+                       max_queue=MAX_QUEUE, name="showui-batcher")
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "model_status": status,
+        "device": device,
+        "precision": precision,
+        "max_pixels": max_pixels,
+        # Clients may send "constrained": true (see README)
+        "constrained_decoding": True,
+        "queue_depth": batcher.depth(),
+        "max_queue": MAX_QUEUE,
+        "vision_cache": vision_cache.stats(),
+        "embedding_cache": embedding_cache.cache.stats() if embedding_cache is not None else None,
+        "prefix_cache": prefix_cache.stats() if prefix_cache is not None else None,
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """200 once the model is loaded and warmed up, 503 before that (or after a failed load)."""
+    if status != "ready":
+        return JSONResponse(status_code=503, content={"status": status})
+    return {"status": status}
+
+
+async def wait_for_result(future, job, http_request: Request):
+    """Await the batch result, cancelling the job if the client disconnects first."""
+    waiter = asyncio.wrap_future(future)
+    while True:
+        done, _ = await asyncio.wait({waiter}, timeout=0.5)
+        if done:
+            return waiter.result()
+        if await http_request.is_disconnected():
+            print("[ShowUI API] Client disconnected, cancelling request")
+            job.cancelled.set()
+            future.cancel()
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest, http_request: Request):
+    # ShowUI-2B is usually used with a single image + query
+    start_time = time.time()
+    print(f"\n[ShowUI API] Received request for model: {request.model}")
+    if status != "ready":
+        raise HTTPException(status_code=503, detail=f"Model is not ready ({status})", headers={"Retry-After": "5"})
+
+    job = build_job(request)
+    try:
+        future = batcher.submit(job)
+    except queue.Full:
+        print(f"[ShowUI API] Queue full ({batcher.depth()} waiting), rejecting request")
+        raise HTTPException(status_code=429, detail=f"Inference queue is full ({batcher.depth()} requests waiting)",
+                            headers={"Retry-After": "1"})
+    output_text = await wait_for_result(future, job, http_request)
+
     if not output_text.strip():
         print("[ShowUI API] Model response is EMPTY!")
-        print(f"[ShowUI API] Generated IDs (first 10): {generated_ids_trimmed[0][:10].tolist()}")
     else:
         print(f"[ShowUI API] Model response: \n{output_text}")
-    print(f"[ShowUI API] Total request time: {total_duration:.2f}s")
+    print(f"[ShowUI API] Total request time: {time.time() - start_time:.2f}s")
+
+    message = {"role": "assistant", "content": output_text}
+    if request.constrained:
+        # Numeric coordinates, so callers don't have to parse the text
+        message["grounding"] = constrained.parse_grounding(output_text)
 
     # Format response in OpenAI style
     response_id = f"chatcmpl-{uuid.uuid4()}"
@@ -192,10 +491,7 @@ async def chat_completions(request: ChatCompletionRequest):
         "choices": [
             {
                 "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": output_text,
-                },
+                "message": message,
                 "finish_reason": "stop"
             }
         ],
@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `max_wait` seconds (or until `max_batch_size`
+    items are waiting) and hands them to `run_batch` in one call on a background thread.
+
+    `run_batch(items)` must return one result per item, in order; an Exception instance
+    as result fails only that item's future. Each `submit` returns
+    a concurrent.futures.Future; futures cancelled before their batch starts are skipped.
+    At most `max_queue` items may wait (0 = unbounded); beyond that `submit` raises queue.Full.
+    """
+
+    def __init__(self, run_batch, max_batch_size=4, max_wait=0.01, max_queue=0, name="batcher"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._stopped = False
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put_nowait((item, future))
+        return future
+
+    def depth(self):
+        """Number of items waiting for a batch."""
+        return self._queue.qsize()
+
+    def _loop(self):
+        while not self._stopped:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._stopped = True
+                    break
+                batch.append(entry)
+            self._run(batch)
+
+    def _run(self, batch):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,168 @@
+"""
+Compare latency and grounding accuracy of running ShowUI services on a fixed screenshot set.
+
+    python benchmark.py screens/dataset.jsonl --server fp32=http://localhost:8005 --server int8=http://localhost:8006
+
+Each dataset line describes one query; paths are relative to the dataset file and the
+target box uses the model's 0-1000 relative coordinates:
+
+    {"image": "login.png", "query": "login button", "bbox": [412, 630, 588, 672]}
+
+A prediction is a hit when its point (or box center) lies inside the target box. The first
+server is the baseline: the other servers also report how far their points land from it.
+With --concurrent, the repeats of a sample are sent at once, like the agent fanning out
+its element queries on one screenshot; the prefix cache hit rate is read from /health.
+"""
+import argparse
+import base64
+import json
+import math
+import mimetypes
+import os
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import urllib.error
+import urllib.request
+
+# Same grounding prompt as the agent's _get_layout_info
+SYSTEM_PROMPT = "Based on the screenshot of the page, I give a text description and you give its corresponding location. The coordinate represents a clickable location [x, y] or a bounding box [xmin, ymin, xmax, ymax] for an element, which is a relative coordinate on the screenshot, scaled from 0 to 1000. Please respond with JSON format like {\"point\": [x, y]} or {\"bbox_2d\": [xmin, ymin, xmax, ymax]}."
+
+COORDS_RE = re.compile(r"\[\s*(-?\d+(?:\.\d+)?(?:\s*,\s*-?\d+(?:\.\d+)?)*)\s*\]")
+
+
+def load_dataset(path):
+    base = os.path.dirname(os.path.abspath(path))
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            image_path = os.path.join(base, sample["image"])
+            mime = mimetypes.guess_type(image_path)[0] or "image/png"
+            with open(image_path, "rb") as img:
+                sample["data_url"] = f"data:{mime};base64,{base64.b64encode(img.read()).decode()}"
+            samples.append(sample)
+    return samples
+
+
+def parse_point(content):
+    match = COORDS_RE.search(content or "")
+    if not match:
+        return None
+    values = [float(v) for v in match.group(1).split(",")]
+    if len(values) == 2:
+        return values[0], values[1]
+    if len(values) == 4:
+        return (values[0] + values[2]) / 2, (values[1] + values[3]) / 2
+    return None
+
+
+def post_json(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def get_json(url, timeout=5):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except (urllib.error.URLError, ValueError):
+        return {}
+
+
+def ground(base_url, sample, max_tokens, timeout):
+    payload = {
+        "model": "showlab/ShowUI-2B",
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": SYSTEM_PROMPT},
+            {"type": "image_url", "image_url": {"url": sample["data_url"]}},
+            {"type": "text", "text": f"Find: {sample['query']}"},
+        ]}],
+    }
+    start = time.perf_counter()
+    response = post_json(f"{base_url}/v1/chat/completions", payload, timeout)
+    elapsed = time.perf_counter() - start
+    return response["choices"][0]["message"]["content"], elapsed
+
+
+def cache_counts(base_url):
+    stats = get_json(f"{base_url}/health").get("prefix_cache") or {}
+    return stats.get("hits", 0), stats.get("misses", 0)
+
+
+def run_server(name, base_url, samples, repeat, max_tokens, timeout, concurrent=False):
+    health = get_json(f"{base_url}/health")
+    print(f"\n== {name} ({base_url}) precision={health.get('precision', '?')} max_pixels={health.get('max_pixels', '?')}")
+    # Warm-up request, not counted
+    ground(base_url, samples[0], max_tokens, timeout)
+    hits_before, misses_before = cache_counts(base_url)
+    latencies = []
+    points = []
+    pool = ThreadPoolExecutor(max_workers=repeat) if concurrent else None
+    for sample in samples:
+        if pool is not None:
+            replies = list(pool.map(lambda _: ground(base_url, sample, max_tokens, timeout), range(repeat)))
+        else:
+            replies = [ground(base_url, sample, max_tokens, timeout) for _ in range(repeat)]
+        latencies.extend(elapsed for _, elapsed in replies)
+        content, elapsed = replies[-1]
+        point = parse_point(content)
+        points.append(point)
+        print(f"  {sample['query'][:40]:40s} -> {point} ({elapsed:.2f}s)")
+    if pool is not None:
+        pool.shutdown()
+    hits_after, misses_after = cache_counts(base_url)
+    lookups = (hits_after - hits_before) + (misses_after - misses_before)
+    hit_rate = (hits_after - hits_before) / lookups if lookups else None
+    return latencies, points, hit_rate
+
+
+def is_hit(point, bbox):
+    return point is not None and bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ShowUI services: latency and grounding accuracy")
+    parser.add_argument("dataset", help="JSONL file with image, query and bbox (0-1000)")
+    parser.add_argument("--server", action="append", required=True, metavar="NAME=URL",
+                        help="Service to test, e.g. fp32=http://localhost:8005 (first one is the baseline)")
+    parser.add_argument("--repeat", type=int, default=3, help="Requests per sample")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--concurrent", action="store_true", help="Send the repeats of each sample at the same time")
+    args = parser.parse_args()
+
+    samples = load_dataset(args.dataset)
+    if not samples:
+        raise SystemExit("dataset is empty")
+    servers = [entry.split("=", 1) if "=" in entry else (entry, entry) for entry in args.server]
+
+    results = []
+    for name, url in servers:
+        latencies, points, hit_rate = run_server(name, url.rstrip("/"), samples, args.repeat, args.max_tokens,
+                                                 args.timeout, args.concurrent)
+        results.append((name, latencies, points, hit_rate))
+
+    baseline = results[0][2]
+    print(f"\n{'server':10s} {'acc':>6s} {'p50 s':>7s} {'p95 s':>7s} {'mean s':>7s} {'dist to baseline':>17s} {'prefix hits':>12s}")
+    for name, latencies, points, hit_rate in results:
+        hits = sum(is_hit(p, s["bbox"]) for p, s in zip(points, samples))
+        distances = [math.dist(p, b) for p, b in zip(points, baseline) if p is not None and b is not None]
+        distance = f"{statistics.mean(distances):.1f}" if distances else "-"
+        prefix_hits = f"{hit_rate:.0%}" if hit_rate is not None else "-"
+        print(f"{name:10s} {hits / len(samples):6.1%} {percentile(latencies, 0.5):7.2f} {percentile(latencies, 0.95):7.2f} "
+              f"{statistics.mean(latencies):7.2f} {distance:>17s} {prefix_hits:>12s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Constrained decoding for grounding answers: the output is forced into one of
+
+    {"point": [x, y]}
+    {"bbox_2d": [x1, y1, x2, y2]}
+
+where each number has up to 4 integer digits and an optional fraction of up to 3 digits,
+and the spaces are optional. End-of-sequence is forced as soon as the closing brace is out.
+"""
+import json
+
+import torch
+from transformers import LogitsProcessor, RepetitionPenaltyLogitsProcessor
+
+NUM = None  # placeholder for a number inside a shape
+SHAPES = (
+    ('{"point": [', NUM, ', ', NUM, ']}'),
+    ('{"bbox_2d": [', NUM, ', ', NUM, ', ', NUM, ', ', NUM, ']}'),
+)
+MAX_INT_DIGITS = 4
+MAX_FRAC_DIGITS = 3
+# Longest answer is a bbox with four 8-character numbers: ~60 single-character tokens
+MAX_NEW_TOKENS = 64
+
+
+def _closure(states):
+    """Add the states reachable without consuming a character."""
+    pending = list(states)
+    states = set(states)
+    while pending:
+        shape, piece, pos, frac = pending.pop()
+        pieces = SHAPES[shape]
+        if piece == len(pieces):
+            continue
+        part = pieces[piece]
+        nxt = None
+        if part is NUM:
+            if pos >= 1 and frac != 0:
+                nxt = (shape, piece + 1, 0, -1)
+        elif pos == len(part):
+            nxt = (shape, piece + 1, 0, -1)
+        elif part[pos] == " ":
+            nxt = (shape, piece, pos + 1, -1)
+        if nxt is not None and nxt not in states:
+            states.add(nxt)
+            pending.append(nxt)
+    return frozenset(states)
+
+
+def _step(states, ch):
+    result = set()
+    for shape, piece, pos, frac in states:
+        pieces = SHAPES[shape]
+        if piece == len(pieces):
+            continue
+        part = pieces[piece]
+        if part is NUM:
+            if ch.isdigit():
+                if frac == -1 and pos < MAX_INT_DIGITS:
+                    result.add((shape, piece, pos + 1, -1))
+                elif 0 <= frac < MAX_FRAC_DIGITS:
+                    result.add((shape, piece, pos, frac + 1))
+            elif ch == "." and frac == -1 and pos >= 1:
+                result.add((shape, piece, pos, 0))
+        elif pos < len(part) and part[pos] == ch:
+            result.add((shape, piece, pos + 1, -1))
+    return _closure(result)
+
+
+def _is_final(states):
+    return any(piece == len(SHAPES[shape]) for shape, piece, _, _ in states)
+
+
+START = _closure({(i, 0, 0, -1) for i in range(len(SHAPES))})
+ALPHABET = set("".join(p for shape in SHAPES for p in shape if p is not NUM)) | set("0123456789.")
+
+
+class GroundingGrammar:
+    """Token-level view of the grammar for one tokenizer; allowed-token sets are cached per state."""
+
+    def __init__(self, tokenizer, eos_token_ids):
+        self.eos_token_ids = list(eos_token_ids)
+        texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+        # Only tokens made of grammar characters can ever be allowed
+        self.candidates = [(i, t) for i, t in enumerate(texts) if t and set(t) <= ALPHABET]
+        self.texts = {i: t for i, t in self.candidates}
+        self._allowed = {}
+
+    def advance(self, states, token_id):
+        for ch in self.texts.get(token_id, ""):
+            states = _step(states, ch)
+        return states
+
+    def allowed(self, states, device):
+        """Tensor of token ids allowed after `states`."""
+        key = (states, device)
+        ids = self._allowed.get(key)
+        if ids is None:
+            if _is_final(states):
+                allowed = self.eos_token_ids
+            else:
+                allowed = [i for i, text in self.candidates if self._accepts(states, text)]
+            ids = self._allowed[key] = torch.tensor(allowed or self.eos_token_ids, dtype=torch.long, device=device)
+        return ids
+
+    @staticmethod
+    def _accepts(states, text):
+        for ch in text:
+            states = _step(states, ch)
+            if not states:
+                return False
+        return True
+
+
+class GroundingLogitsProcessor(LogitsProcessor):
+    """
+    Masks the logits of constrained rows (`constrained[row]` is True) to the grammar.
+    The prompt length is taken from the first call, so the same processor works whether
+    generate gets the padded prompt or a cached prefix plus the remaining tokens.
+    """
+
+    def __init__(self, grammar, constrained):
+        self.grammar = grammar
+        self.constrained = constrained
+        self.prompt_length = None
+        self.states = [START] * len(constrained)
+
+    def __call__(self, input_ids, scores):
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1]
+        generated = input_ids.shape[1] - self.prompt_length
+        for row, constrained in enumerate(self.constrained):
+            if not constrained:
+                continue
+            if generated > 0:
+                self.states[row] = self.grammar.advance(self.states[row], int(input_ids[row, -1]))
+            allowed = self.grammar.allowed(self.states[row], scores.device)
+            masked = torch.full_like(scores[row], float("-inf"))
+            masked[allowed] = scores[row, allowed]
+            scores[row] = masked
+        return scores
+
+
+class RowRepetitionPenalty(LogitsProcessor):
+    """repetition_penalty for the rows where `rows[row]` is True; constrained rows are left alone,
+    since coordinates repeat digits and the penalty would fight the grammar."""
+
+    def __init__(self, penalty, rows):
+        self.penalty = RepetitionPenaltyLogitsProcessor(penalty)
+        self.rows = [row for row, enabled in enumerate(rows) if enabled]
+
+    def __call__(self, input_ids, scores):
+        if self.rows:
+            rows = torch.tensor(self.rows, device=scores.device)
+            scores[rows] = self.penalty(input_ids[rows], scores[rows])
+        return scores
+
+
+def parse_grounding(text):
+    """Numeric form of a constrained answer, e.g. {"point": [512, 300]}; None if it is incomplete."""
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
@@ -0,0 +1,66 @@
+"""
+CPU serving options for the ShowUI service (used when no GPU is available).
+
+    SHOWUI_CPU_PRECISION   fp32 (default) | int8 (dynamic quantization of Linear layers) | bf16
+    SHOWUI_THREADS         intra-op threads, e.g. the number of physical cores
+    SHOWUI_INTEROP_THREADS inter-op threads
+    SHOWUI_COMPILE         1 to torch.compile the language model
+"""
+import os
+
+import torch
+
+PRECISIONS = ("fp32", "int8", "bf16")
+
+
+def configure_threads():
+    """Apply thread settings; call at process start, before the first parallel torch op."""
+    threads = int(os.getenv("SHOWUI_THREADS", "0"))
+    interop = int(os.getenv("SHOWUI_INTEROP_THREADS", "0"))
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if interop > 0:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError as e:
+            # Only allowed before any inter-op parallel work has started
+            print(f"[ShowUI API] Could not set inter-op threads: {e}")
+    print(f"[ShowUI API] CPU threads: intra-op {torch.get_num_threads()}, inter-op {torch.get_num_interop_threads()}")
+
+
+def cpu_precision():
+    precision = os.getenv("SHOWUI_CPU_PRECISION", "fp32").lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"SHOWUI_CPU_PRECISION must be one of {', '.join(PRECISIONS)}, got {precision!r}")
+    if precision == "bf16" and not bf16_supported():
+        print("[ShowUI API] bf16 is not supported by this CPU, falling back to fp32")
+        return "fp32"
+    return precision
+
+
+def bf16_supported():
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def load_dtype(precision):
+    """dtype to load the weights in; int8 quantizes from fp32 weights."""
+    return torch.bfloat16 if precision == "bf16" else torch.float32
+
+
+def optimize(model, precision, compile_model=None):
+    """Quantize and/or compile a model loaded with `load_dtype(precision)`, in place."""
+    if precision == "int8":
+        # Weights are stored as int8, activations are quantized on the fly per batch
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print("[ShowUI API] Applied dynamic int8 quantization to Linear layers")
+    if compile_model is None:
+        compile_model = os.getenv("SHOWUI_COMPILE", "0") == "1"
+    if compile_model:
+        # Qwen2-VL keeps the text decoder on .model (older) or .model.language_model (newer)
+        text_model = getattr(model.model, "language_model", model.model)
+        text_model.forward = torch.compile(text_model.forward, dynamic=True)
+        print("[ShowUI API] Compiled the language model with torch.compile")
+    return model
@@ -0,0 +1,55 @@
+import copy
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """
+    Keeps the prompt KV cache of recent generations (one unpadded prompt each), keyed by image hash.
+
+    Later prompts on the same image, alone or in a batch, reuse the longest token prefix they
+    all share with the stored prompt (image tokens plus the shared system text) and only
+    prefill the remaining query tokens. Entries are copied before use, so the stored cache is
+    never extended by a generation.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (input_ids, cache, rope_deltas)
+
+    def lookup(self, key, rows, min_length):
+        """
+        Return (cache, rope_deltas, prefix_length) for the prompts `rows` (1-D token ids,
+        without padding), or None when they do not all share at least `min_length` leading
+        tokens with the stored prompt. At least one token of every row is left to prefill.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        ids, cache, rope_deltas = entry
+        length = len(ids)
+        for row in rows:
+            limit = min(length, len(row) - 1)
+            same = ids[:limit] == row[:limit]
+            length = limit if bool(same.all()) else int(same.int().argmin())
+        if length < min_length:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        cache = copy.deepcopy(cache)
+        cache.crop(length)
+        return cache, rope_deltas, length
+
+    def store(self, key, input_ids, cache, rope_deltas):
+        """Store the KV cache of a finished generation, trimmed to its prompt."""
+        cache.crop(len(input_ids))
+        self._entries[key] = (input_ids.clone(), cache, rope_deltas.clone())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
@@ -1,10 +1,92 @@
 import uvicorn
 import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+
+def serve_workers(host, port, workers):
+    """
+    Load the model once in this process, then fork the workers. The weight tensors are
+    shared copy-on-write instead of every worker loading its own copy.
+
+    Loading and quantizing run torch ops, and a multi-threaded OpenMP pool started here
+    would not survive the fork (GNU OpenMP hangs in the child). The parent therefore does
+    all of its work with a single thread; each worker sets its own share of the threads
+    after the fork and then starts the inference thread and the warm-up. Workers that exit
+    unexpectedly are restarted.
+    """
+    import torch
+    import app as showui
+
+    if showui.device != "cpu":
+        raise SystemExit("--workers > 1 shares weights through fork and needs CPU inference; run one process per GPU instead")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    threads = max(1, torch.get_num_threads() // workers)
+    torch.set_num_threads(1)
+    showui.load_model()
+    # Keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            torch.set_num_threads(threads)
+            uvicorn.Server(uvicorn.Config(showui.app)).run(sockets=[sock])
+            os._exit(0)
+        return pid
+
+    children = {spawn() for _ in range(workers)}
+    print(f"Started {workers} workers ({threads} threads each) on {host}:{port}: {sorted(children)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl+C reaches the workers directly through the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while children:
+        try:
+            pid, code = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if stopping or code == 0:
+            continue
+        print(f"Worker {pid} exited unexpectedly (status {code}), restarting")
+        # Avoid a tight restart loop when a worker crashes at startup
+        time.sleep(1)
+        if not stopping:
+            children.add(spawn())
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run ShowUI-2B OpenAI Compatible API")
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind to")
     parser.add_argument("--port", type=int, default=8005, help="Port to bind to")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing one preloaded copy of the weights (CPU only)")
     args = parser.parse_args()
 
-    uvicorn.run("app:app", host=args.host, port=args.port, reload=False)
+    if args.workers > 1:
+        serve_workers(args.host, args.port, args.workers)
+    else:
+        uvicorn.run("app:app", host=args.host, port=args.port, reload=False)
@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+import torch
+
+
+def tensor_bytes(*tensors):
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ByteLRU:
+    """LRU cache bounded by the total size (in bytes) of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+class VisionEmbeddingCache:
+    """
+    Wraps the vision tower's forward so image embeddings are reused across requests.
+
+    Before each generate, set `pending_keys` to the content hash of every image in the
+    batch (in the order of `image_grid_thw`). The wrapped forward splits the batch per
+    image, runs the tower only on images not yet cached (each distinct image once) and
+    reassembles the embeddings in order. Calls without matching keys, e.g. a second
+    forward within the same generate, fall through to the original forward.
+    """
+
+    def __init__(self, visual, max_bytes):
+        self.visual = visual
+        self.cache = ByteLRU(max_bytes)
+        self.pending_keys = None
+        self._forward = visual.forward
+        self._merge = getattr(visual, "spatial_merge_size", 2) ** 2
+        visual.forward = self.forward
+
+    def forward(self, pixel_values, grid_thw=None, **kwargs):
+        keys, self.pending_keys = self.pending_keys, None
+        if keys is None or grid_thw is None or len(keys) != len(grid_thw):
+            return self._forward(pixel_values, grid_thw=grid_thw, **kwargs)
+
+        patches = [int(n) for n in grid_thw.prod(dim=-1)]
+        offsets = [0]
+        for n in patches:
+            offsets.append(offsets[-1] + n)
+
+        embeddings = {}
+        missing = []
+        for i, key in enumerate(keys):
+            if key in embeddings:
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                embeddings[key] = cached
+            else:
+                embeddings[key] = None
+                missing.append(i)
+
+        if missing:
+            rows = torch.cat([pixel_values[offsets[i]:offsets[i + 1]] for i in missing])
+            output = self._forward(rows, grid_thw=grid_thw[missing], **kwargs)
+            if not isinstance(output, torch.Tensor):
+                # Unknown output format in this transformers version: don't cache
+                return self._forward(pixel_values, grid_thw=grid_thw, **kwargs)
+            start = 0
+            for i in missing:
+                count = patches[i] // self._merge
+                embedding = output[start:start + count]
+                start += count
+                embeddings[keys[i]] = embedding
+                self.cache.put(keys[i], embedding, tensor_bytes(embedding))
+
+        return torch.cat([embeddings[key] for key in keys])
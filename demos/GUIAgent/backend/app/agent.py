@@ -1,20 +1,33 @@
 import os
-import base64
-import cv2
+import time
+import importlib.util
 import httpx
 import json
 import asyncio
 import re
 import ast
+from collections import namedtuple
 from dotenv import load_dotenv
+from usb_hid_toolkit import UnknownKeyError
 from .camera import CameraService
+from .frames import FrameProcessor, grounding_point, remap_grounding, roi_around
+from .grounding_cache import GroundingCache, fingerprint, hamming
 from .hid import hid_service
+from .streaming import ActionStreamParser, iter_sse_content
 
 load_dotenv()
 
+# 安装了 h2 时启用 HTTP/2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 一次观察：采集时的帧序号、图像副本、画面指纹与 layout 变体的 base64 图像，
+# 指纹与编码都在取帧时完成，之后（规划结束后）的定位只使用这里保存的结果
+Observation = namedtuple("Observation", ["seq", "image", "fingerprint", "layout_image"])
+
 class GUIAgent:
-    def __init__(self, camera: CameraService):
+    def __init__(self, camera: CameraService, frames: FrameProcessor = None):
         self.camera = camera
+        self.frames = frames or FrameProcessor()
         
         # 基础配置 (用于单模型模式)
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -25,44 +38,255 @@ class GUIAgent:
         self.layout_base_url = os.getenv("LAYOUT_BASE_URL")
         self.layout_api_key = os.getenv("LAYOUT_API_KEY")
         self.layout_model = os.getenv("LAYOUT_MODEL")
+        # 受限解码（只生成坐标 JSON）是本地 ShowUI 服务的扩展字段，严格的 OpenAI 兼容服务会拒绝它：
+        # auto（默认）时只在服务的 /health 声明支持时发送，1 总是发送，0 从不发送
+        self.layout_constrained = os.getenv("LAYOUT_CONSTRAINED", "auto").lower()
+        self._layout_constrained_supported = None
         
         # 决策推理模型 (Reasoner model, e.g. Ernie, GPT-4o)
         self.reasoner_base_url = os.getenv("REASONER_BASE_URL")
         self.reasoner_api_key = os.getenv("REASONER_API_KEY")
         self.reasoner_model = os.getenv("REASONER_MODEL")
         
+        # 画面稳定检测：动作后等待屏幕连续若干帧不再变化，代替固定的 sleep
+        self.settle_frames = int(os.getenv("SETTLE_FRAMES", "3"))
+        self.settle_threshold = float(os.getenv("SETTLE_THRESHOLD", "2.0"))
+        self.settle_timeout = float(os.getenv("SETTLE_TIMEOUT", "1.5"))
+
+        # 定位结果缓存：同一画面上的重复查询直接返回
+        self.grounding_cache = GroundingCache(
+            max_entries=int(os.getenv("GROUNDING_CACHE_SIZE", "256")),
+            max_distance=int(os.getenv("GROUNDING_CACHE_DISTANCE", "0")),
+            region_threshold=int(os.getenv("GROUNDING_CACHE_THRESHOLD", "8")),
+        )
+        self._action_epoch = 0 # 每次执行 HID 动作加一，鼠标指针等易变目标的缓存只在同一 epoch 内有效
+
+        # 所有模型请求共享一个连接池，复用 keep-alive 连接
+        self.grounding_concurrency = int(os.getenv("GROUNDING_CONCURRENCY", "4"))
+        self._http = None
+
+        # 模型输入预处理：按各模型的像素预算缩小后再编码，避免上传服务端反正会缩小的全分辨率画面
+        quality = int(os.getenv("MODEL_JPEG_QUALITY", "85"))
+        self.frames.configure("model", quality=quality, max_pixels=int(os.getenv("VLM_MAX_PIXELS", str(1280 * 720))))
+        self.frames.configure("layout", quality=quality, max_pixels=int(os.getenv("LAYOUT_MAX_PIXELS", str(1344 * 28 * 28))))
+        # 鼠标指针只在上次定位的目标附近的区域内查找，值为区域占画面的比例，0 表示关闭
+        self.grounding_roi = float(os.getenv("GROUNDING_ROI", "0"))
+        self._last_target = None # 最近一次定位到的目标元素，整幅画面上的 0-1000 坐标
+
+        # 流式请求决策：边生成边解析，第一个完整的动作到达就开始执行
+        self.stream = os.getenv("AGENT_STREAM", "0") == "1"
+
         self.history = [] # 记录最近几次的动作与思考，实现闭环反思
         self.is_running = False
 
+    def _client(self):
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=60.0,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
     async def think_and_act(self, user_goal: str):
         self.is_running = True
         try:
             # 1. 采集当前画面
-            frame = self.camera.get_frame()
+            seq, frame = self.camera.get_latest()
             if frame is None:
                 return {"error": "No camera frame available"}
 
-            # 2. 编码图片
-            _, buffer = cv2.imencode('.jpg', frame)
-            base64_image = base64.b64encode(buffer).decode('utf-8')
-
-            # 3. 构造历史信息
-            history_text = ""
-            if self.history:
-                history_text = "\n最近动作记录：\n" + "\n".join([
-                    f"- 动作: {h.get('action')}, 思考: {h.get('thought','')[:50]}..."
-                    for h in self.history[-3:]
-                ])
+            # 2. 构造历史信息
+            history_text = self._history_text()
 
             raw_content = ""
+            scale = 1.0
             
             # 判断是否进入混合模式 (Hybrid Mode)
             if self.layout_model and self.reasoner_model:
                 print(f"\n[Agent] 进入混合模式: Layout({self.layout_model}) + Reasoner({self.reasoner_model})")
                 
+                # 画面指纹与定位图像在取帧时计算，与规划并行
+                observation = asyncio.ensure_future(self._observe(seq, frame))
+
                 # --- 第一阶段: 规划 (Planning) ---
-                # 推理模型先理解任务，确定需要交互的元素或位置
-                plan_prompt = f"""你是一个 GUI 操作规划器。基于用户目标和屏幕画面，分析需要的具体操作步骤。
+                try:
+                    plan_info = await self._plan(user_goal, history_text)
+                except BaseException:
+                    observation.cancel()
+                    raise
+
+                # --- 第二阶段: 定位 (Grounding with ShowUI) ---
+                layout_info = await self._ground_plan(plan_info, await observation)
+
+                # --- 第三阶段: 执行 (Execution) ---
+                if self.stream:
+                    return await self._stream_and_execute(*self._reasoner_request(self._decide_prompt(user_goal, plan_info, layout_info)))
+                raw_content = await self._decide(user_goal, plan_info, layout_info)
+
+            else:
+                # --- 单模型传统模式 (Original Mode) ---
+                print(f"\n[Agent] 正在请求单模型 VLM (Model: {self.model})...")
+                # 按 VLM 像素预算缩小并编码（在线程池中完成，同一帧的结果会被缓存）
+                base64_image = await self.frames.get_base64(seq, frame, "model")
+                # 模型给出的是缩小后图像上的像素位移，执行前换算回原始画面的尺度
+                scale = frame.shape[1] / self.frames.output_size(frame, "model")[0]
+                model_str = (self.model or "").lower()
+                is_showui = "showui" in model_str
+                
+                if is_showui:
+                    system_prompt = """You are an AI assistant controlling a real mouse via relative movements (dx, dy).
+You see the current screen image. You need to identify where the mouse cursor IS and where it SHOULD BE.
+
+Action Space:
+1. CLICK: Click the current position. 
+2. INPUT: Type 'value'.
+3. ENTER: Press enter.
+4. FINISH: Task completed.
+
+IMPORTANT: Because our hardware uses RELATIVE movement, you MUST include "dx" and "dy" in pixels.
+MUST return your response in a ```json code block.
+Format your response as:
+```json
+[
+  {'thought': 'current mouse is at [100, 100], target is [200, 300], so dx=100, dy=200', 'action': 'CLICK', 'dx': 100, 'dy': 200}
+]
+```
+"""
+                    prompt = f"{system_prompt}\n\nTask: {user_goal}\n{history_text}"
+                else:
+                    prompt = f"""你是一个智能视觉助手，通过观察屏幕截图来操作电脑。
+你不能直接看到坐标，但你可以通过观察鼠标指针的位置来决定如何移动。
+
+用户目标: "{user_goal}"
+{history_text}
+
+请在```json代码块中返回一个 JSON 列表。每个对象必须包含：
+- thought: 你的思考过程，说明你看到了什么，鼠标在哪，目标在哪。
+- action: 动作类型 ("CLICK", "INPUT", "ENTER", "WAIT", "FINISH")。
+- dx, dy: 鼠标的相对位移像素值（例如：dx: 100 表示向右移动100像素）。
+- value: 如果是 INPUT，请输入字符串内容。
+
+示例格式:
+```json
+[
+  {{"thought": "我看到任务栏图标在右侧，当前鼠标在中间。我需要向右移动并点击。", "action": "CLICK", "dx": 200, "dy": 0}}
+]
+```
+"""
+                if self.stream:
+                    return await self._stream_and_execute(*self._vlm_request(prompt, base64_image), scale=scale)
+                raw_content = await self._get_vlm_response(prompt, base64_image)
+                print(f"[Agent] VLM 原始回复: \n{raw_content}")
+
+            # 3. 解析与执行
+            return await self._parse_and_execute_content(raw_content, user_goal, scale)
+
+        except Exception as e:
+            print(f"[Agent] 发生未预期错误: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return {"error": str(e)}
+        finally:
+            self.is_running = False
+
+    async def run_pipelined(self, user_goal: str, max_steps: int, on_step):
+        """
+        流水线模式（仅混合模式）。第 N 步的动作执行、等待画面稳定期间，第 N+1 步的规划已经开始
+        （规划只依赖目标与历史，不依赖画面）；画面稳定后立即编码并预取定位结果。
+        如果决策前画面又发生了变化，丢弃预取的定位结果并在新画面上重新定位；
+        任务结束或出错时取消尚未完成的推测任务。
+        on_step(step, result) 是每步结束后调用的异步回调。
+        """
+        if not (self.layout_model and self.reasoner_model):
+            raise ValueError("Pipelined mode requires LAYOUT_MODEL and REASONER_MODEL")
+        self.is_running = True
+        plan_task = None
+        prefetch = None
+        step = 0
+        try:
+            plan_task = asyncio.ensure_future(self._plan(user_goal, self._history_text()))
+            for step in range(1, max_steps + 1):
+                if prefetch is None:
+                    prefetch = asyncio.ensure_future(self._observe_and_ground(plan_task))
+                observed, plan_info, layout_info = await prefetch
+                prefetch = None
+                if observed is None:
+                    await on_step(step, {"error": "No camera frame available"})
+                    break
+
+                # 预取之后画面又变了：在最新画面上重新定位
+                latest = self.camera.get_latest_frame()
+                latest_fp = await self._fingerprint(latest.image) if latest.seq != observed.seq else observed.fingerprint
+                if hamming(latest_fp.hash, observed.fingerprint.hash) > self.grounding_cache.max_distance:
+                    print("[Agent] 画面已变化，丢弃预取的定位结果")
+                    observed, plan_info, layout_info = await self._observe_and_ground(plan_task)
+
+                raw_content = await self._decide(user_goal, plan_info, layout_info)
+                decisions = self._parse_decisions(raw_content)
+                if not decisions:
+                    await on_step(step, {"error": "Could not parse any valid actions"})
+                    break
+
+                # 推测：假设本步动作都会成功，立即开始下一步的规划。
+                # 推测的动作只出现在规划提示中，执行成功后才写入 self.history
+                finished = any(str(d.get('action', '')).upper() == 'FINISH' for d in decisions)
+                pending = []
+                for decision in decisions:
+                    if str(decision.get('action', '')).upper() == 'FINISH':
+                        break
+                    pending.append(decision)
+                plan_task = None if finished else asyncio.ensure_future(self._plan(user_goal, self._history_text(pending)))
+
+                result = await self._execute_decisions(decisions)
+                if result.get("status") == "finished" or "error" in result:
+                    await on_step(step, result)
+                    break
+                # 动作已执行且画面已稳定，在回调期间预取下一步
+                prefetch = asyncio.ensure_future(self._observe_and_ground(plan_task))
+                await on_step(step, result)
+        except Exception as e:
+            print(f"[Agent] 流水线模式发生错误: {str(e)}")
+            # 动作可能中途被打断，松开所有按键与鼠标按钮
+            await self._release_inputs()
+            try:
+                await on_step(step, {"error": str(e)})
+            except Exception as callback_error:
+                # 例如 WebSocket 已关闭
+                print(f"[Agent] 无法上报错误: {callback_error}")
+        finally:
+            for task in (plan_task, prefetch):
+                if task is not None and not task.done():
+                    task.cancel()
+            self.is_running = False
+
+    async def _observe_and_ground(self, plan_task):
+        """采集最新画面并立即编码与计算指纹，再等待规划结果并定位"""
+        frame = self.camera.get_latest_frame()
+        if frame is None:
+            return None, None, None
+        observed = await self._observe(frame.seq, frame.image)
+        plan_info = await plan_task
+        layout_info = await self._ground_plan(plan_info, observed)
+        return observed, plan_info, layout_info
+
+    async def _observe(self, seq, image):
+        """取帧后立即并行完成 layout 编码与画面指纹；image 必须是副本（camera.get_latest*() 的返回值）"""
+        layout_image, frame_fp = await asyncio.gather(
+            self.frames.get_base64(seq, image, "layout"),
+            self._fingerprint(image),
+        )
+        return Observation(seq, image, frame_fp, layout_image)
+
+    async def _plan(self, user_goal, history_text):
+        """规划阶段：只依赖用户目标与历史动作，不依赖当前画面"""
+        # 推理模型先理解任务，确定需要交互的元素或位置
+        plan_prompt = f"""你是一个 GUI 操作规划器。基于用户目标和屏幕画面，分析需要的具体操作步骤。
 
 用户目标："{user_goal}"
 {history_text}
@@ -109,50 +333,64 @@ class GUIAgent:
 
 注意：必须包括鼠标指针位置，这样执行阶段才能精确计算相对位移。
 """
-                async with httpx.AsyncClient() as client:
-                    plan_payload = {
-                        "model": self.reasoner_model,
-                        "messages": [{"role": "user", "content": plan_prompt}]
-                    }
-                    headers = {"Authorization": f"Bearer {self.reasoner_api_key or self.api_key}", "Content-Type": "application/json"}
-                    plan_resp = await client.post(f"{self.reasoner_base_url or self.base_url}/chat/completions", 
-                                                  headers=headers,
-                                                  json=plan_payload, timeout=60.0)
-                    plan_text = plan_resp.json()['choices'][0]['message']['content'] if plan_resp.status_code == 200 else ""
-                    print(f"[Agent] 规划步骤:\n{plan_text}")
-                    
-                    # 提取规划中的 JSON
-                    import re
-                    plan_json_match = re.search(r'```json\s*(.*?)\s*```', plan_text, re.DOTALL)
-                    plan_info = plan_json_match.group(1).strip() if plan_json_match else plan_text
+        plan_payload = {
+            "model": self.reasoner_model,
+            "messages": [{"role": "user", "content": plan_prompt}]
+        }
+        headers = {"Authorization": f"Bearer {self.reasoner_api_key or self.api_key}", "Content-Type": "application/json"}
+        plan_resp = await self._client().post(f"{self.reasoner_base_url or self.base_url}/chat/completions", 
+                                              headers=headers,
+                                              json=plan_payload, timeout=60.0)
+        plan_text = plan_resp.json()['choices'][0]['message']['content'] if plan_resp.status_code == 200 else ""
+        print(f"[Agent] 规划步骤:\n{plan_text}")
+        
+        # 提取规划中的 JSON
+        plan_json_match = re.search(r'```json\s*(.*?)\s*```', plan_text, re.DOTALL)
+        plan_info = plan_json_match.group(1).strip() if plan_json_match else plan_text
+        return plan_info
+
+    async def _ground_plan(self, plan_info, observed):
+        """定位阶段：在观察到的画面上为规划中的每个元素定位坐标，返回 JSON 字符串"""
+        # 为每个规划中的元素定位坐标
+        locations = {}
+        try:
+            plan_list = json.loads(plan_info)
+        except:
+            plan_list = []
+        
+        if isinstance(plan_list, list):
+            elements = [e for e in plan_list if isinstance(e, dict)]
+            semaphore = asyncio.Semaphore(self.grounding_concurrency)
+
+            async def ground(element):
+                target_name = element.get("target_element", "")
+                description = element.get("description", "")
+                # 为每个元素单独调用 ShowUI，所有元素并发定位
+                query = f"Find: {target_name}\nDescription: {description}"
+                async with semaphore:
+                    return await self._ground(observed, query, bool(element.get("is_reference")))
+
+            results = await asyncio.gather(*(ground(e) for e in elements))
+            for element, element_location in zip(elements, results):
+                target_name = element.get("target_element", "")
+                locations[target_name] = element_location
+                print(f"[Agent] 定位 '{target_name}': {element_location}")
+                if not element.get("is_reference"):
+                    self._last_target = grounding_point(element_location) or self._last_target
+        
+        layout_info = json.dumps(locations, ensure_ascii=False)
+        print(f"[Agent] 所有元素定位结果:\n{layout_info}\n" + "-"*30)
+        return layout_info
 
-                # --- 第二阶段: 定位 (Grounding with ShowUI) ---
-                # 为每个规划中的元素定位坐标
-                locations = {}
-                try:
-                    plan_list = json.loads(plan_info)
-                except:
-                    plan_list = []
-                
-                if isinstance(plan_list, list):
-                    for element in plan_list:
-                        if not isinstance(element, dict):
-                            continue
-                        target_name = element.get("target_element", "")
-                        description = element.get("description", "")
-                        
-                        # 为每个元素单独调用 ShowUI
-                        query = f"Find: {target_name}\nDescription: {description}"
-                        element_location = await self._get_layout_info(base64_image, query)
-                        locations[target_name] = element_location
-                        print(f"[Agent] 定位 '{target_name}': {element_location}")
-                
-                layout_info = json.dumps(locations, ensure_ascii=False)
-                print(f"[Agent] 所有元素定位结果:\n{layout_info}\n" + "-"*30)
+    async def _decide(self, user_goal, plan_info, layout_info):
+        """执行阶段：推理模型根据规划与定位结果给出具体动作"""
+        raw_content = await self._get_reasoner_decision(self._decide_prompt(user_goal, plan_info, layout_info))
+        print(f"[Agent] 执行指令: \n{raw_content}")
+        return raw_content
 
-                # --- 第三阶段: 执行 (Execution) ---
-                # 推理模型根据规划和坐标，精确计算位移并执行
-                exec_prompt = f"""你是一个 GUI 操作执行器。基于规划、视觉定位结果和屏幕画面，精确计算并执行操作。
+    def _decide_prompt(self, user_goal, plan_info, layout_info):
+        # 推理模型根据规划和坐标，精确计算位移并执行
+        return f"""你是一个 GUI 操作执行器。基于规划、视觉定位结果和屏幕画面，精确计算并执行操作。
 
 用户目标："{user_goal}"
 
@@ -186,68 +424,66 @@ class GUIAgent:
 ]
 ```
 """
-                raw_content = await self._get_reasoner_decision(exec_prompt)
-                print(f"[Agent] 执行指令: \n{raw_content}")
 
-            else:
-                # --- 单模型传统模式 (Original Mode) ---
-                print(f"\n[Agent] 正在请求单模型 VLM (Model: {self.model})...")
-                model_str = (self.model or "").lower()
-                is_showui = "showui" in model_str
-                
-                if is_showui:
-                    system_prompt = """You are an AI assistant controlling a real mouse via relative movements (dx, dy).
-You see the current screen image. You need to identify where the mouse cursor IS and where it SHOULD BE.
-
-Action Space:
-1. CLICK: Click the current position. 
-2. INPUT: Type 'value'.
-3. ENTER: Press enter.
-4. FINISH: Task completed.
-
-IMPORTANT: Because our hardware uses RELATIVE movement, you MUST include "dx" and "dy" in pixels.
-MUST return your response in a ```json code block.
-Format your response as:
-```json
-[
-  {'thought': 'current mouse is at [100, 100], target is [200, 300], so dx=100, dy=200', 'action': 'CLICK', 'dx': 100, 'dy': 200}
-]
-```
-"""
-                    prompt = f"{system_prompt}\n\nTask: {user_goal}\n{history_text}"
-                else:
-                    prompt = f"""你是一个智能视觉助手，通过观察屏幕截图来操作电脑。
-你不能直接看到坐标，但你可以通过观察鼠标指针的位置来决定如何移动。
-
-用户目标: "{user_goal}"
-{history_text}
-
-请在```json代码块中返回一个 JSON 列表。每个对象必须包含：
-- thought: 你的思考过程，说明你看到了什么，鼠标在哪，目标在哪。
-- action: 动作类型 ("CLICK", "INPUT", "ENTER", "WAIT", "FINISH")。
-- dx, dy: 鼠标的相对位移像素值（例如：dx: 100 表示向右移动100像素）。
-- value: 如果是 INPUT，请输入字符串内容。
-
-示例格式:
-```json
-[
-  {{"thought": "我看到任务栏图标在右侧，当前鼠标在中间。我需要向右移动并点击。", "action": "CLICK", "dx": 200, "dy": 0}}
-]
-```
-"""
-                raw_content = await self._get_vlm_response(prompt, base64_image)
-                print(f"[Agent] VLM 原始回复: \n{raw_content}")
-
-            # 4. 解析与执行
-            return await self._parse_and_execute_content(raw_content, user_goal)
-
-        except Exception as e:
-            print(f"[Agent] 发生未预期错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {"error": str(e)}
-        finally:
-            self.is_running = False
+    async def _fingerprint(self, frame):
+        return await asyncio.get_running_loop().run_in_executor(None, fingerprint, frame)
+
+    def _history_text(self, pending=()):
+        """pending: 尚未执行、推测会成功的动作，只用于提示，不写入 self.history"""
+        history = self.history + list(pending)
+        if not history:
+            return ""
+        return "\n最近动作记录：\n" + "\n".join([
+            f"- 动作: {h.get('action')}, 思考: {h.get('thought','')[:50]}..."
+            for h in history[-3:]
+        ])
+
+    async def _ground(self, observed, query, volatile=False):
+        """带缓存的元素定位。volatile 表示目标会随动作变化（如鼠标指针），其缓存只在本次动作前有效"""
+        epoch = self._action_epoch if volatile else None
+        cached = self.grounding_cache.get(observed.fingerprint, query, epoch)
+        if cached is not None:
+            print(f"[Agent] 定位缓存命中: {query.splitlines()[0]}")
+            return cached
+        result = None
+        if volatile and self.grounding_roi and self._last_target is not None:
+            result = await self._ground_roi(observed, query)
+        if result is None:
+            result = await self._get_layout_info(observed.layout_image, query)
+        if not result.startswith(("Error", "Layout Error")):
+            self.grounding_cache.put(observed.fingerprint, query, result, epoch)
+        return result
+
+    async def _ground_roi(self, observed, query):
+        """
+        只把上次目标附近的区域发给 ShowUI（动作之后鼠标指针通常在那里），结果换算回整幅画面的坐标。
+        裁剪的是观察时保存的图像副本，而不是规划结束时的最新画面。
+        定位失败或结果贴近区域边缘（指针可能在区域之外）时返回 None，由调用方在整幅画面上重新定位。
+        """
+        frame = observed.image
+        roi = roi_around(frame.shape, self._last_target, self.grounding_roi)
+        base64_image = await self.frames.get_base64(observed.seq, frame, "layout", roi)
+        result = await self._get_layout_info(base64_image, query)
+        point = grounding_point(result)
+        if point is None or not all(20 < v < 980 for v in point):
+            return None
+        return remap_grounding(result, roi, frame.shape)
+
+    async def _use_constrained(self):
+        if self.layout_constrained in ("0", "false", "off"):
+            return False
+        if self.layout_constrained != "auto":
+            return True
+        if self._layout_constrained_supported is None:
+            # LAYOUT_BASE_URL 形如 http://host:8005/v1，/health 在服务根路径下
+            health_url = re.sub(r"/v1/?$", "", (self.layout_base_url or "").rstrip("/")) + "/health"
+            try:
+                resp = await self._client().get(health_url, timeout=5.0)
+                self._layout_constrained_supported = resp.status_code == 200 and resp.json().get("constrained_decoding") is True
+            except Exception:
+                self._layout_constrained_supported = False
+            print(f"[Agent] 定位服务受限解码: {'支持' if self._layout_constrained_supported else '不支持'}")
+        return self._layout_constrained_supported
 
     async def _get_layout_info(self, base64_image, user_goal):
         """调用 Layout 模型 (ShowUI) 结合用户目标提取 UI 信息
@@ -266,34 +502,37 @@ Format your response as:
                 {"type": "text", "text": user_goal}
             ]}]
         }
+        if await self._use_constrained():
+            payload.update(constrained=True, max_tokens=64)
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(f"{self.layout_base_url}/chat/completions", headers=headers, json=payload, timeout=60.0)
-                if resp.status_code == 200:
-                    content = resp.json()['choices'][0]['message']['content']
-                    return content
-                return f"Error: {resp.status_code}"
+            resp = await self._client().post(f"{self.layout_base_url}/chat/completions", headers=headers, json=payload, timeout=60.0)
+            if resp.status_code == 200:
+                content = resp.json()['choices'][0]['message']['content']
+                return content
+            return f"Error: {resp.status_code}"
         except Exception as e:
             return f"Layout Error: {str(e)}"
 
-    async def _get_reasoner_decision(self, prompt):
-        """调用推理模型做出决策"""
+    def _reasoner_request(self, prompt):
         headers = {"Authorization": f"Bearer {self.reasoner_api_key or self.api_key}", "Content-Type": "application/json"}
         payload = {
             "model": self.reasoner_model,
             "messages": [{"role": "user", "content": prompt}]
         }
+        return f"{self.reasoner_base_url or self.base_url}/chat/completions", headers, payload
+
+    async def _get_reasoner_decision(self, prompt):
+        """调用推理模型做出决策"""
+        url, headers, payload = self._reasoner_request(prompt)
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(f"{self.reasoner_base_url or self.base_url}/chat/completions", headers=headers, json=payload, timeout=60.0)
-                if resp.status_code == 200:
-                    return resp.json()['choices'][0]['message']['content']
-                return f"Error: {resp.status_code}"
+            resp = await self._client().post(url, headers=headers, json=payload, timeout=60.0)
+            if resp.status_code == 200:
+                return resp.json()['choices'][0]['message']['content']
+            return f"Error: {resp.status_code}"
         except Exception as e:
             return f"Reasoner Error: {str(e)}"
 
-    async def _get_vlm_response(self, prompt, base64_image):
-        """单 VLM 模式下的原始请求"""
+    def _vlm_request(self, prompt, base64_image):
         headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
         payload = {
             "model": self.model,
@@ -302,54 +541,98 @@ Format your response as:
                 {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
             ]}]
         }
+        return f"{self.base_url}/chat/completions", headers, payload
+
+    async def _get_vlm_response(self, prompt, base64_image):
+        """单 VLM 模式下的原始请求"""
+        url, headers, payload = self._vlm_request(prompt, base64_image)
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(f"{self.base_url}/chat/completions", headers=headers, json=payload, timeout=60.0)
-                if resp.status_code == 200:
-                    return resp.json()['choices'][0]['message']['content']
-                return f"Error: {resp.status_code}"
+            resp = await self._client().post(url, headers=headers, json=payload, timeout=60.0)
+            if resp.status_code == 200:
+                return resp.json()['choices'][0]['message']['content']
+            return f"Error: {resp.status_code}"
         except Exception as e:
             return f"VLM Error: {str(e)}"
 
-    async def _parse_and_execute_content(self, content, user_goal):
+    async def _stream_and_execute(self, url, headers, payload, scale=1.0):
+        """
+        以 SSE 流式请求模型，每解析出一个完整的动作对象就立即执行，模型继续生成后续内容时鼠标已经在移动。
+        遇到 FINISH 或执行出错时停止读取；流中没有解析出任何动作时，按完整回复再解析一次。
+        """
+        parser = ActionStreamParser()
+        chunks = []
+        last_result = None
         try:
-            # 尝试提取代码块
-            json_match = re.search(r'```(?:json|python)?\s*(.*?)\s*```', content, re.DOTALL)
-            clean_content = json_match.group(1).strip() if json_match else content.strip()
-            
-            decisions = []
-            try:
-                parsed = ast.literal_eval(clean_content)
-                if isinstance(parsed, list): decisions = parsed
-                elif isinstance(parsed, tuple): decisions = list(parsed)
-                else: decisions = [parsed]
-            except Exception:
-                # 兜底：寻找多个 {}
-                potential_dicts = re.findall(r'\{[^{}]*\}', clean_content)
-                for d_str in potential_dicts:
-                    try: decisions.append(ast.literal_eval(d_str))
-                    except: continue
-            
+            async with self._client().stream("POST", url, headers=headers, json=dict(payload, stream=True), timeout=60.0) as resp:
+                if resp.status_code != 200:
+                    return {"error": f"Model Error: {resp.status_code}"}
+                async for delta in iter_sse_content(resp):
+                    chunks.append(delta)
+                    for decision in parser.feed(delta):
+                        if str(decision.get('action', '')).upper() == 'FINISH':
+                            return {"status": "finished", "thought": decision.get('thought')}
+                        if scale != 1.0:
+                            _scale_move(decision, scale)
+                        print(f"[Agent] 流式解析到动作: {decision}")
+                        last_result = await self._execute(decision)
+                        if "error" in last_result:
+                            return last_result
+                        self.history.append(decision)
+        except Exception as e:
+            return {"error": f"Stream Error: {str(e)}"}
+        finally:
+            print(f"[Agent] 模型流式回复: \n{''.join(chunks)}")
+
+        if last_result is None:
+            return await self._parse_and_execute_content("".join(chunks), None, scale)
+        return last_result
+
+    async def _parse_and_execute_content(self, content, user_goal, scale=1.0):
+        try:
+            decisions = self._parse_decisions(content)
             if not decisions:
                 return {"error": "Could not parse any valid actions"}
-
-            last_result = None
-            for decision in decisions:
-                if not isinstance(decision, dict): continue
-                
-                action = str(decision.get('action', '')).upper()
-                if action == 'FINISH':
-                    return {"status": "finished", "thought": decision.get('thought')}
-                
-                last_result = await self._execute(decision)
-                self.history.append(decision)
-                await asyncio.sleep(0.5)
-            
-            return last_result or {"status": "empty"}
-            
+            if scale != 1.0:
+                for decision in decisions:
+                    _scale_move(decision, scale)
+            return await self._execute_decisions(decisions)
         except Exception as e:
             return {"error": f"Parse/Exec Error: {str(e)}"}
 
+    def _parse_decisions(self, content):
+        # 尝试提取代码块
+        json_match = re.search(r'```(?:json|python)?\s*(.*?)\s*```', content, re.DOTALL)
+        clean_content = json_match.group(1).strip() if json_match else content.strip()
+        
+        decisions = []
+        try:
+            parsed = ast.literal_eval(clean_content)
+            if isinstance(parsed, list): decisions = parsed
+            elif isinstance(parsed, tuple): decisions = list(parsed)
+            else: decisions = [parsed]
+        except Exception:
+            # 兜底：寻找多个 {}
+            potential_dicts = re.findall(r'\{[^{}]*\}', clean_content)
+            for d_str in potential_dicts:
+                try: decisions.append(ast.literal_eval(d_str))
+                except: continue
+        return [d for d in decisions if isinstance(d, dict)]
+
+    async def _execute_decisions(self, decisions):
+        last_result = None
+        for decision in decisions:
+            action = str(decision.get('action', '')).upper()
+            if action == 'FINISH':
+                return {"status": "finished", "thought": decision.get('thought')}
+            
+            last_result = await self._execute(decision)
+            if "error" in last_result:
+                # 失败的动作不写入历史，后续动作也不再执行
+                return last_result
+            self.history.append(decision)
+        
+        return last_result or {"status": "empty"}
+
     async def _execute(self, decision):
         action = str(decision.get("action", "")).upper()
         params = decision.get("params", {})
@@ -361,6 +644,15 @@ Format your response as:
         if not hid_service.client:
             return {"error": "HID not connected"}
 
+        async def send(call, *args):
+            # HID 调用内部用 time.sleep 控制按键间隔，放到线程中执行，流水线模式下规划与定位不会被阻塞；
+            # 只有数据包确实发出后才使易变目标（鼠标指针等）的缓存失效
+            sent = await asyncio.to_thread(call, *args)
+            if sent:
+                self._action_epoch += 1
+            return sent
+
+        failed = {"error": "HID send failed"}
         try:
             dx = get_p("dx")
             dy = get_p("dy")
@@ -369,22 +661,68 @@ Format your response as:
                 # 硬件限制通常单次较小，这里做个保护
                 dx, dy = max(-400, min(400, dx)), max(-400, min(400, dy))
                 print(f"[Agent] 执行位移: dx={dx}, dy={dy}")
-                hid_service.execute_mouse_relative(dx, dy)
-                await asyncio.sleep(0.2)
+                since = time.monotonic()
+                if not await send(hid_service.execute_mouse_relative, dx, dy):
+                    return failed
+                await self._wait_settle(since)
 
             if action in ["CLICK", "TAP"]:
-                hid_service.execute_mouse_click(get_p("button", "left"))
-                await asyncio.sleep(0.8)
+                since = time.monotonic()
+                if not await send(hid_service.execute_mouse_click, get_p("button", "left")):
+                    return failed
+                await self._wait_settle(since)
             elif action in ["TYPE", "INPUT"]:
                 text = get_p("text") or get_p("value", "")
-                for char in str(text):
-                    hid_service.execute_keyboard_tap(char)
-                    await asyncio.sleep(0.05)
+                since = time.monotonic()
+                try:
+                    if not await send(hid_service.execute_keyboard_type, str(text), 0.05):
+                        return failed
+                except UnknownKeyError as e:
+                    # 整段文本先检查再输入，出错时目标机上没有输入任何字符
+                    return {"error": f"Cannot type text with HID layout: {e}"}
+                await self._wait_settle(since)
             elif action == "ENTER":
-                hid_service.execute_keyboard_tap("\n")
+                since = time.monotonic()
+                if not await send(hid_service.execute_keyboard_tap, "\n"):
+                    return failed
+                await self._wait_settle(since)
             elif action == "WAIT":
                 await asyncio.sleep(float(get_p("seconds", 1.0)))
             
             return {"status": "success", "action": action}
         except Exception as e:
             return {"error": f"HID execution error: {str(e)}"}
+
+    async def _release_inputs(self):
+        """松开所有按键与鼠标按钮，用于动作被中断之后"""
+        if not hid_service.client:
+            return
+        try:
+            await asyncio.to_thread(hid_service.client.keyboard.release_all, True)
+            await asyncio.to_thread(hid_service.client.mouse.release_all, True)
+        except Exception as e:
+            print(f"[Agent] 松开按键失败: {e}")
+
+    async def _wait_settle(self, since):
+        """等待动作（since 时刻发出）之后画面稳定，超时则继续执行"""
+        settled = await self.camera.wait_for_settle(
+            stable_frames=self.settle_frames,
+            threshold=self.settle_threshold,
+            timeout=self.settle_timeout,
+            after=since,
+        )
+        if not settled:
+            print(f"[Agent] 画面在 {self.settle_timeout}s 内未稳定，继续执行")
+        return settled
+
+
+def _scale_move(decision, scale):
+    """按 scale 缩放决策中的 dx/dy"""
+    for key in ("dx", "dy"):
+        value = decision.get(key)
+        if value is None:
+            continue
+        try:
+            decision[key] = round(float(value) * scale)
+        except (TypeError, ValueError):
+            pass
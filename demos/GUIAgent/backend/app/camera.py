@@ -1,17 +1,31 @@
+import asyncio
 import cv2
+import numpy as np
 import threading
 import time
+from collections import namedtuple
+
+# seq: 单调递增的帧序号；timestamp: 采集完成时的 time.monotonic()；image: BGR 图像
+Frame = namedtuple("Frame", ["seq", "timestamp", "image"])
+
 
 class CameraService:
-    def __init__(self, camera_source=0, width=None, height=None):
+    def __init__(self, camera_source=0, width=None, height=None, ring_size=8):
         # camera_source 可以是整数索引（本地摄像头），也可以是 URL 字符串（如 MJPEG 流）
         self.camera_source = camera_source
         self.width = width
         self.height = height
+        self.ring_size = ring_size
         self.cap = None
-        self.latest_frame = None
+        self.frame_seq = 0 # 每采集到一帧加一，消费者据此判断画面是否更新
         self.is_running = False
         self._lock = threading.Lock()
+        # 预分配的环形帧缓冲，采集直接写入其中，避免每帧分配新数组。
+        # 缓冲区的视图只在之后 ring_size - 1 帧内有效：get_latest*() 返回副本，
+        # next_frame() 等等待接口返回视图，只能在当前协程中立即使用；交给其他线程（如编码线程池）前必须复制。
+        self._ring = None
+        self._stamps = [0.0] * ring_size
+        self._waiters = []
 
     def start(self):
         if self.is_running:
@@ -19,32 +33,144 @@ class CameraService:
         self.cap = cv2.VideoCapture(self.camera_source)
         if not self.cap.isOpened():
             raise Exception(f"Could not open camera source: {self.camera_source}")
-        
+
         # 设置分辨率
         if self.width:
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         if self.height:
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        
+
         print(f"[Camera] Started with resolution: {self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}")
-        
+
         self.is_running = True
         self.thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.thread.start()
 
     def _capture_loop(self):
         while self.is_running:
-            ret, frame = self.cap.read()
-            if ret:
-                with self._lock:
-                    self.latest_frame = frame
-            time.sleep(0.01) # 控制采样率
+            slot = (self.frame_seq + 1) % self.ring_size
+            buffer = self._ring[slot] if self._ring is not None else None
+            ret, frame = self.cap.read(buffer)
+            if not ret:
+                time.sleep(0.01)
+                continue
+            if buffer is None or frame.shape != buffer.shape:
+                # 首帧或分辨率变化：按实际尺寸重新分配环形缓冲
+                self._allocate(frame.shape)
+                buffer = self._ring[slot]
+                buffer[...] = frame
+            elif frame is not buffer:
+                buffer[...] = frame
+            self._publish(slot, time.monotonic())
 
-    def get_frame(self):
+    def _allocate(self, shape):
+        with self._lock:
+            self._ring = np.empty((self.ring_size,) + shape, dtype=np.uint8)
+            self._stamps = [0.0] * self.ring_size
+
+    def _publish(self, slot, timestamp):
+        with self._lock:
+            self._stamps[slot] = timestamp
+            self.frame_seq += 1
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # 等待方的事件循环已关闭
+                pass
+
+    def get_latest_frame(self):
+        """返回最新的 Frame（图像为副本，可以跨 await 长期持有），尚无画面时返回 None"""
+        frame = self._latest_view()
+        if frame is None:
+            return None
+        return frame._replace(image=frame.image.copy())
+
+    def get_latest(self):
+        """返回 (frame_seq, frame)，frame 为副本"""
+        frame = self.get_latest_frame()
+        if frame is None:
+            return 0, None
+        return frame.seq, frame.image
+
+    def _latest_view(self):
+        """最新的 Frame，图像是环形缓冲区的视图，不复制"""
         with self._lock:
-            return self.latest_frame
+            if self._ring is None or self.frame_seq == 0:
+                return None
+            slot = self.frame_seq % self.ring_size
+            return Frame(self.frame_seq, self._stamps[slot], self._ring[slot])
+
+    def get_frame(self):
+        return self.get_latest()[1]
+
+    async def next_frame(self, after_seq=None, timeout=None):
+        """
+        等待序号大于 after_seq 的帧（默认为调用时的最新序号），返回最新的 Frame。
+        图像是环形缓冲区的视图，会在 ring_size - 1 帧之后被覆盖，需要跨 await 保留或交给其他线程时请复制。
+        超时抛出 asyncio.TimeoutError。
+        """
+        if after_seq is None:
+            after_seq = self.frame_seq
+        return await self._wait(lambda f: f.seq > after_seq, timeout)
+
+    async def wait_for_frame(self, newer_than, timeout=None):
+        """等待采集时间晚于 newer_than（time.monotonic()）的帧，例如 HID 动作之后的第一帧"""
+        return await self._wait(lambda f: f.timestamp > newer_than, timeout)
+
+    async def _wait(self, predicate, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            with self._lock:
+                self._waiters.append((loop, future))
+            frame = self._latest_view()
+            if frame is not None and predicate(frame):
+                return frame
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError()
+            await asyncio.wait_for(future, remaining)
+
+    async def wait_for_settle(self, stable_frames=3, threshold=2.0, timeout=2.0, after=None, min_delay=0.05, size=(64, 36)):
+        """
+        等待画面稳定：连续 stable_frames 对相邻帧（缩小后的灰度图）的平均像素差都小于 threshold 时返回 True，
+        超时返回 False。只比较 after（time.monotonic()，默认为调用时刻）+ min_delay 之后采集的帧，
+        以跳过动作生效前就已采集的画面。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        since = (time.monotonic() if after is None else after) + min_delay
+        previous = None
+        stable = 0
+        try:
+            frame = await self.wait_for_frame(since, timeout)
+            while True:
+                current = _settle_signature(frame.image, size)
+                if previous is not None:
+                    diff = np.abs(current - previous).mean()
+                    stable = stable + 1 if diff < threshold else 0
+                    if stable >= stable_frames:
+                        return True
+                previous = current
+                frame = await self.next_frame(frame.seq, deadline - loop.time())
+        except asyncio.TimeoutError:
+            return False
 
     def stop(self):
         self.is_running = False
         if self.cap:
             self.cap.release()
+
+
+def _settle_signature(image, size):
+    # 先缩小再转灰度，只处理几千个像素
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,209 @@
+import asyncio
+import base64
+import json
+import math
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+# 编码变体：JPEG 质量、最大宽度、最大像素数（None 表示不限制）
+VARIANTS = {
+    "preview": {"quality": 70, "max_width": None},                         # 前端实时预览
+    "model": {"quality": 85, "max_width": None, "max_pixels": 1280 * 720},  # 单模型 VLM 的输入
+    "layout": {"quality": 85, "max_width": None, "max_pixels": 1344 * 28 * 28},  # ShowUI 定位的输入，与服务端 max_pixels 一致
+    "small": {"quality": 70, "max_width": 640},                             # 缩略图
+}
+
+
+class FrameDropped(ValueError):
+    """排队中的预览编码任务被新帧取代，或因排队任务过多被丢弃"""
+
+
+class FrameProcessor:
+    """
+    帧处理阶段：JPEG 编码、缩放、base64 在线程池中完成，不阻塞事件循环。
+    结果按 (帧序号, 变体) 缓存，同一帧的同一变体只计算一次，并发请求共享同一个结果。
+    droppable 中的变体（实时预览）每个只保留最新一帧，且排队任务超过 max_pending 个时最先被挤出：
+    被取代或挤出队列的任务以 FrameDropped 结束，不会持有旧帧无限排队。
+    其他变体（Agent 的模型输入）按 (帧序号, 变体) 排队，从不被丢弃。
+    """
+    def __init__(self, max_workers=2, max_pending=4, cache_frames=4, droppable=("preview",)):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame")
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._droppable = set(droppable)
+        self._waiting = OrderedDict()  # 预览为变体，其他为 (帧序号, 变体) -> (func, future)，按提交顺序排列
+        self._running = 0
+        self._cache_frames = cache_frames
+        self._cache = OrderedDict()  # seq -> {variant: Future}
+        self.variants = {name: dict(options) for name, options in VARIANTS.items()}
+
+    def configure(self, variant, **options):
+        """修改（或新增）某个变体的编码参数，例如按模型设置像素预算"""
+        self.variants.setdefault(variant, {}).update(options)
+
+    def output_size(self, frame, variant, roi=None):
+        """该变体编码后的 (宽, 高)，用于把模型在缩放图上给出的像素值换算回原图"""
+        height, width = _crop_size(frame.shape, roi)
+        options = self.variants[variant]
+        return _target_size(width, height, options.get("max_width"), options.get("max_pixels"))
+
+    async def get(self, seq, frame, variant="preview", roi=None):
+        """返回指定帧的 JPEG 字节。roi 为 (x0, y0, x1, y1) 像素区域，只编码该区域"""
+        key = variant if roi is None else f"{variant}@{roi}"
+        options = self.variants[variant]
+        return await self._result(seq, key, lambda: encode_jpeg(frame, roi=roi, **options), variant in self._droppable)
+
+    async def get_base64(self, seq, frame, variant="model", roi=None):
+        """返回指定帧的 base64 JPEG 字符串"""
+        jpeg = await self.get(seq, frame, variant, roi)
+        key = (variant if roi is None else f"{variant}@{roi}") + ":b64"
+        return await self._result(seq, key, lambda: base64.b64encode(jpeg).decode("utf-8"), variant in self._droppable)
+
+    async def _result(self, seq, key, func, droppable=False):
+        entry = self._cache.get(seq)
+        if entry is None:
+            entry = self._cache[seq] = {}
+            while len(self._cache) > self._cache_frames:
+                self._cache.popitem(last=False)
+        future = entry.get(key)
+        if future is None:
+            future = entry[key] = self._submit(seq, key, func, droppable)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            entry.pop(key, None)
+            raise
+
+    def _submit(self, seq, key, func, droppable):
+        if droppable:
+            # 预览的旧帧还没开始编码时直接取代它，避免帧积压
+            waiting_key = key
+            previous = self._waiting.pop(key, None)
+            if previous is not None:
+                _drop(previous[1], f"superseded by a newer frame ({key})")
+        else:
+            waiting_key = (seq, key)
+            if waiting_key in self._waiting:
+                # 缓存已淘汰但同一任务仍在排队，共用它而不是重复编码
+                return self._waiting[waiting_key][1]
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[waiting_key] = (func, future)
+        # 队列过长时只挤出更早的预览任务，刚提交的一帧与 Agent 的任务总会执行
+        while len(self._waiting) > self._max_pending:
+            oldest = next((k for k in self._waiting if not isinstance(k, tuple) and k != waiting_key), None)
+            if oldest is None:
+                break
+            _drop(self._waiting.pop(oldest)[1], "too many pending encodes")
+        self._drain()
+        return future
+
+    def _drain(self):
+        loop = asyncio.get_running_loop()
+        while self._waiting and self._running < self._max_workers:
+            _, (func, future) = self._waiting.popitem(last=False)
+            self._running += 1
+            task = loop.run_in_executor(self._executor, func)
+            task.add_done_callback(lambda task, future=future: self._finished(task, future))
+
+    def _finished(self, task, future):
+        self._running -= 1
+        if not future.done():
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        self._drain()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _drop(future, reason):
+    if not future.done():
+        future.set_exception(FrameDropped(reason))
+        # 没有等待方时避免 "exception was never retrieved" 警告
+        future.exception()
+
+
+def encode_jpeg(frame, quality=95, max_width=None, max_pixels=None, roi=None):
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        frame = frame[y0:y1, x0:x1]
+    height, width = frame.shape[:2]
+    size = _target_size(width, height, max_width, max_pixels)
+    if size != (width, height):
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+def _crop_size(shape, roi):
+    if roi is None:
+        return shape[0], shape[1]
+    x0, y0, x1, y1 = roi
+    return y1 - y0, x1 - x0
+
+
+def _target_size(width, height, max_width=None, max_pixels=None):
+    """等比缩小到不超过 max_width 与 max_pixels，不放大"""
+    scale = 1.0
+    if max_width and width > max_width:
+        scale = max_width / width
+    if max_pixels and width * height * scale * scale > max_pixels:
+        scale = math.sqrt(max_pixels / (width * height))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def roi_around(shape, center, fraction):
+    """
+    以 center（0-1000 归一化坐标）为中心、边长为画面 fraction 倍的裁剪区域，
+    靠近边缘时整体平移到画面内。返回 (x0, y0, x1, y1) 像素坐标。
+    """
+    height, width = shape[:2]
+    w, h = int(width * fraction), int(height * fraction)
+    cx, cy = center[0] * width / 1000, center[1] * height / 1000
+    x0 = min(max(0, int(cx - w / 2)), width - w)
+    y0 = min(max(0, int(cy - h / 2)), height - h)
+    return x0, y0, x0 + w, y0 + h
+
+
+_COORDS_RE = re.compile(r"\[\s*(-?\d+(?:\.\d+)?(?:\s*,\s*-?\d+(?:\.\d+)?)*)\s*\]")
+
+
+def grounding_point(content):
+    """从 ShowUI 的回复（{"point": [x, y]} 或 {"bbox_2d": [...]}）中取出点坐标，bbox 取中心；解析失败返回 None"""
+    match = _COORDS_RE.search(content or "")
+    if not match:
+        return None
+    values = [float(v) for v in match.group(1).split(",")]
+    if len(values) == 2:
+        return values[0], values[1]
+    if len(values) == 4:
+        return (values[0] + values[2]) / 2, (values[1] + values[3]) / 2
+    return None
+
+
+def remap_grounding(content, roi, shape):
+    """把裁剪图上的 0-1000 归一化坐标换算为整幅画面上的 0-1000 坐标，返回与原回复同格式的字符串"""
+    height, width = shape[:2]
+    x0, y0, x1, y1 = roi
+
+    def remap(match):
+        values = [float(v) for v in match.group(1).split(",")]
+        mapped = []
+        for i, v in enumerate(values):
+            if i % 2 == 0:
+                mapped.append(round((x0 + v / 1000 * (x1 - x0)) / width * 1000))
+            else:
+                mapped.append(round((y0 + v / 1000 * (y1 - y0)) / height * 1000))
+        return json.dumps(mapped)
+
+    return _COORDS_RE.sub(remap, content, count=1)
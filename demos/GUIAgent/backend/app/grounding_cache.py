@@ -0,0 +1,95 @@
+from collections import OrderedDict, namedtuple
+import cv2
+import numpy as np
+from .frames import grounding_point
+
+# hash: 感知哈希，用于查找；thumb: 缩小的灰度图，用于校验缓存的目标附近画面是否变化
+Fingerprint = namedtuple("Fingerprint", ["hash", "thumb"])
+
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    """感知哈希：缩小后的灰度图做 DCT，取低频分量与中位数比较，得到 64 位整数"""
+    size = hash_size * highfreq_factor
+    small = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    dct = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size]
+    bits = (dct > np.median(dct)).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def fingerprint(image, thumb_size=(128, 72)):
+    """画面指纹，应在采集画面时立即计算"""
+    thumb = cv2.resize(image, thumb_size, interpolation=cv2.INTER_AREA)
+    if thumb.ndim == 3:
+        thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+    return Fingerprint(phash(thumb), thumb)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class GroundingCache:
+    """
+    定位结果缓存，键为 (画面感知哈希, 规范化后的查询文本)，LRU 淘汰。
+    画面哈希的汉明距离不超过 max_distance 时视为同一画面（默认 0，哈希必须相同）。
+    64 位哈希区分不了按钮移动、列表内容变化等局部变化，所以命中前还要比较缩略图：
+    缓存结果坐标附近（各方向 region 倍画面尺寸）的最大灰度差超过 region_threshold 时视为未命中。
+    epoch 用于易变目标（如鼠标指针）：带 epoch 写入的结果只在相同 epoch 内命中。
+    """
+    def __init__(self, max_entries=256, max_distance=0, region=0.06, region_threshold=8):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.region = region
+        self.region_threshold = region_threshold
+        self._entries = OrderedDict()  # (frame_hash, query) -> (epoch, result, thumb)
+
+    def get(self, frame, query, epoch=None):
+        """frame 为 fingerprint() 的结果"""
+        query = normalize_query(query)
+        keys = [(frame.hash, query)]
+        if self.max_distance > 0:
+            keys += [key for key in reversed(self._entries)
+                     if key[1] == query and key[0] != frame.hash and hamming(key[0], frame.hash) <= self.max_distance]
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            cached_epoch, result, thumb = entry
+            if cached_epoch is not None and cached_epoch != epoch:
+                continue
+            if not self._unchanged(thumb, frame.thumb, result):
+                continue
+            self._entries.move_to_end(key)
+            return result
+        return None
+
+    def put(self, frame, query, result, epoch=None):
+        key = (frame.hash, normalize_query(query))
+        self._entries[key] = (epoch, result, frame.thumb)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _unchanged(self, before, after, result):
+        """比较缓存结果坐标（0-1000）附近的缩略图；解析不出坐标时比较整幅缩略图"""
+        if before.shape != after.shape:
+            return False
+        height, width = after.shape[:2]
+        point = grounding_point(result)
+        if point is not None:
+            cx, cy = int(point[0] * width / 1000), int(point[1] * height / 1000)
+            rx, ry = max(1, int(width * self.region)), max(1, int(height * self.region))
+            window = (slice(max(0, cy - ry), cy + ry + 1), slice(max(0, cx - rx), cx + rx + 1))
+            before, after = before[window], after[window]
+            if before.size == 0:
+                return False
+        return int(cv2.absdiff(before, after).max()) <= self.region_threshold
@@ -2,9 +2,23 @@ from usb_hid_toolkit import USBHidClient
 from usb_hid_toolkit.transmitters import TCPTransmitter
 import os
 
+class CheckedTCPTransmitter(TCPTransmitter):
+    """记录发送失败的次数：键盘 / 鼠标对象会吞掉 send() 的返回值，由此判断一次动作是否全部送达"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = 0
+
+    def send(self, packet: bytes):
+        ok = super().send(packet)
+        if ok is False:
+            self.failures += 1
+        return ok
+
+
 class HIDService:
     def __init__(self):
         self.client = None
+        self.transmitter = None
 
     def connect(self, host: str, port: int = 80):
         """
@@ -21,8 +35,11 @@ class HIDService:
             sock.settimeout(2)
             result = sock.connect_ex((host, port))
             if result == 0:
-                transmitter = TCPTransmitter(host=host, port=port)
-                self.client = USBHidClient(transmitter=transmitter)
+                transmitter = CheckedTCPTransmitter(host=host, port=port)
+                # 目标机键盘布局，例如 us / fr / de
+                layout = os.getenv("HID_LAYOUT", "us")
+                self.client = USBHidClient(transmitter=transmitter, layout=layout)
+                self.transmitter = transmitter
                 # 握手验证：发送一个全释放指令，确保协议层能正常送达
                 self.client.keyboard.release_all()
                 return True, f"成功连接并验证硬件: {host}"
@@ -37,22 +54,34 @@ class HIDService:
     def execute_mouse_relative(self, dx: int, dy: int):
         if self.client:
             print(f"[HID] 鼠标位移: dx={dx}, dy={dy}")
+            failures = self.transmitter.failures
             self.client.mouse.move(x=dx, y=dy)
-            return True
+            # 有数据包发送失败时返回 False
+            return self.transmitter.failures == failures
         return False
 
     def execute_mouse_click(self, button: str = 'left'):
         if self.client:
             print(f"[HID] 鼠标按钮点击: {button}")
+            failures = self.transmitter.failures
             self.client.mouse.click(button)
-            return True
+            return self.transmitter.failures == failures
         return False
 
     def execute_keyboard_tap(self, key: str):
         if self.client:
             print(f"[HID] 键盘敲击: {key}")
+            failures = self.transmitter.failures
             self.client.keyboard.tap(key)
-            return True
+            return self.transmitter.failures == failures
+        return False
+
+    def execute_keyboard_type(self, text: str, interval: float = 0.0):
+        if self.client:
+            print(f"[HID] 键盘输入: {text}")
+            failures = self.transmitter.failures
+            self.client.keyboard.type_text(text, interval=interval)
+            return self.transmitter.failures == failures
         return False
 
 # 单例模式
@@ -3,9 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from .camera import CameraService
 from .hid import hid_service
 from .agent import GUIAgent
-import cv2
-import base64
-import asyncio
+from .frames import FrameProcessor
+from .video import VideoBroadcaster
 
 app = FastAPI()
 
@@ -35,8 +34,13 @@ res_map = {
 
 width, height = res_map.get(CAMERA_RES, (1280, 720))
 
+# 流水线模式：执行当前步动作的同时规划下一步（仅混合模式），可被请求中的 pipelined 字段覆盖
+AGENT_PIPELINE = os.getenv("AGENT_PIPELINE", "0") == "1"
+
 camera = CameraService(camera_source=CAMERA_SOURCE, width=width, height=height)
-gui_agent = GUIAgent(camera)
+frame_processor = FrameProcessor()
+gui_agent = GUIAgent(camera, frames=frame_processor)
+video_hub = VideoBroadcaster(camera, frame_processor)
 
 @app.on_event("startup")
 async def startup_event():
@@ -45,6 +49,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     camera.stop()
+    frame_processor.shutdown()
+    await gui_agent.aclose()
 
 @app.get("/")
 def read_root():
@@ -52,18 +58,17 @@ def read_root():
 
 @app.websocket("/ws/video")
 async def video_feed(websocket: WebSocket):
+    """以二进制消息推送 JPEG 帧，仅在摄像头产生新帧时发送"""
     await websocket.accept()
+    queue = video_hub.subscribe()
     try:
         while True:
-            frame = camera.get_frame()
-            if frame is not None:
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                if ret:
-                    base64_frame = base64.b64encode(buffer).decode('utf-8')
-                    await websocket.send_text(base64_frame)
-            await asyncio.sleep(0.05)
+            jpeg = await queue.get()
+            await websocket.send_bytes(jpeg)
     except WebSocketDisconnect:
         print("Client disconnected from video feed")
+    finally:
+        video_hub.unsubscribe(queue)
 
 @app.post("/connect")
 def connect_hid(config: dict):
@@ -93,6 +98,14 @@ async def agent_task_ws(websocket: WebSocket):
                 continue
 
             print(f"[WS Agent] 开始任务: {goal}")
+
+            if data.get('pipelined', AGENT_PIPELINE) and gui_agent.layout_model and gui_agent.reasoner_model:
+                async def send_step(step, result):
+                    await websocket.send_json({"status": "step", "step": step, "data": result})
+
+                await gui_agent.run_pipelined(goal, max_steps, send_step)
+                await websocket.send_json({"status": "completed"})
+                continue
             
             for i in range(max_steps):
                 # 思考并执行一步
@@ -110,8 +123,7 @@ async def agent_task_ws(websocket: WebSocket):
                 
                 if "error" in result:
                     break
-                
-                await asyncio.sleep(0.5)
+                # 动作之后的等待由 Agent 的画面稳定检测完成，这里不再额外 sleep
             
             await websocket.send_json({"status": "completed"})
             
@@ -0,0 +1,72 @@
+import ast
+import json
+
+
+async def iter_sse_content(response):
+    """逐段产出 OpenAI 兼容 SSE 流 (chat/completions, stream=true) 中的文本增量"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+class ActionStreamParser:
+    """
+    增量解析模型输出中的动作对象：每次 feed 一段文本，返回其中新出现的、已经完整的顶层 {...} 对象。
+    兼容 JSON 与 Python 字面量（单引号）写法，字符串内的括号不参与匹配；解析失败的对象被忽略。
+    """
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self._depth == 0:
+                # 对象之外的文字（说明、代码块标记）直接跳过
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+            self._buffer.append(ch)
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "\"'":
+                self._quote = ch
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = _literal("".join(self._buffer))
+                    if isinstance(obj, dict):
+                        objects.append(obj)
+        return objects
+
+
+def _literal(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
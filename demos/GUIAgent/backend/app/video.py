@@ -0,0 +1,50 @@
+import asyncio
+from .frames import FrameDropped
+
+
+class VideoBroadcaster:
+    """
+    视频流广播：每个新帧只编码一次，以二进制 JPEG 推送给所有订阅者。
+    每个订阅者只保留最新一帧，处理不过来的客户端直接丢弃旧帧而不是排队。
+    """
+    def __init__(self, camera, frames, variant="preview"):
+        self.camera = camera
+        self.frames = frames
+        self.variant = variant
+        self._subscribers = set()
+        self._task = None
+        self._last_seq = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    async def _run(self):
+        # 没有订阅者时退出，下一次 subscribe 再启动；单帧出错只记录并跳过，不结束广播
+        try:
+            while self._subscribers:
+                try:
+                    frame = await self.camera.next_frame(self._last_seq or 0, timeout=1.0)
+                    self._last_seq = frame.seq
+                    # 编码在线程池中排队执行，期间采集线程可能覆盖环形缓冲区的这一格，先复制
+                    jpeg = await self.frames.get(frame.seq, frame.image.copy(), self.variant)
+                except (asyncio.TimeoutError, FrameDropped):
+                    continue
+                except Exception as e:
+                    print(f"[Video] 视频帧处理失败: {e!r}")
+                    await asyncio.sleep(0.5)
+                    continue
+                for queue in self._subscribers:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(jpeg)
+        finally:
+            self._last_seq = None
+            if self._task is asyncio.current_task():
+                self._task = None
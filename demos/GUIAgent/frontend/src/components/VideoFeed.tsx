@@ -5,16 +5,24 @@ const VideoFeed: React.FC = () => {
     const [status, setStatus] = useState<'connecting' | 'connected' | 'error'>('connecting');
     const imgRef = useRef<HTMLImageElement>(null);
     const wsRef = useRef<WebSocket | null>(null);
+    const urlRef = useRef<string | null>(null);
 
     useEffect(() => {
         const connect = () => {
             const ws = new WebSocket('ws://localhost:8000/ws/video');
+            ws.binaryType = 'blob';
             wsRef.current = ws;
 
             ws.onopen = () => setStatus('connected');
             ws.onmessage = (event) => {
-                if (imgRef.current) {
-                    imgRef.current.src = `data:image/jpeg;base64,${event.data}`;
+                // 后端以二进制消息推送 JPEG
+                if (imgRef.current && event.data instanceof Blob) {
+                    const url = URL.createObjectURL(event.data);
+                    if (urlRef.current) {
+                        URL.revokeObjectURL(urlRef.current);
+                    }
+                    urlRef.current = url;
+                    imgRef.current.src = url;
                 }
             };
             ws.onclose = () => {
@@ -25,7 +33,12 @@ const VideoFeed: React.FC = () => {
         };
 
         connect();
-        return () => wsRef.current?.close();
+        return () => {
+            wsRef.current?.close();
+            if (urlRef.current) {
+                URL.revokeObjectURL(urlRef.current);
+            }
+        };
     }, []);
 
     return (
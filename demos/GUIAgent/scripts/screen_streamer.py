@@ -1,57 +1,314 @@
 import cv2
 import numpy as np
 import mss
-from flask import Flask, Response
+from flask import Flask, Response, request
+import math
+import threading
 import time
 
 app = Flask(__name__)
 
 # 配置
-FPS = 15  # 限制帧率以减轻网络负担
+FPS = 15  # 最高帧率，限制以减轻网络负担
+MIN_FPS = 2  # 画面静止时采样帧率逐步降到此值
 QUALITY = 70  # JPEG 编码质量
+KEEPALIVE = 1.0  # 画面静止时重发上一帧的间隔（秒），避免客户端判定超时
+BLOCK = 32  # 变化检测的分块大小（像素）
+DIFF_THRESHOLD = 12  # 块内最大像素差超过此值视为变化，过滤编码噪声
+MAX_REGIONS = 16  # 分块模式下变化区域超过此数量时直接发送整帧
+SCALES = (0.25, 0.5, 0.75, 1.0)  # 客户端可选的缩放档位
+QUALITIES = (30, 50, 70, 85)  # 客户端可选的 JPEG 质量档位
 
-def generate_frames():
-    with mss.mss() as sct:
-        # 获取第一块显示器
-        monitor = sct.monitors[1]
-        
+
+class ChangeDetector:
+    """把相邻两帧切成 BLOCK x BLOCK 的块并逐块比较，返回变化块的布尔掩码"""
+    def __init__(self, block=BLOCK, threshold=DIFF_THRESHOLD):
+        self.block = block
+        self.threshold = threshold
+        self.previous = None
+        self._padded = None
+
+    def update(self, frame):
+        h, w = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        rows, cols = -(-h // self.block), -(-w // self.block)
+        if self.previous is None or self.previous.shape != frame.shape:
+            self.previous = frame.copy()
+            self._padded = np.zeros((rows * self.block, cols * self.block * channels), dtype=np.uint8)
+            return np.ones((rows, cols), dtype=bool)
+        # 补齐到整块后 reshape：先沿块内的行求最大值，再沿块内的列（含通道）求最大值，
+        # 两次归约都在连续内存上进行
+        padded = self._padded
+        padded[:h, :w * channels] = cv2.absdiff(frame, self.previous).reshape(h, -1)
+        blocks = padded.reshape(rows, self.block, -1).max(axis=1)
+        blocks = blocks.reshape(rows, cols, -1).max(axis=2)
+        mask = blocks > self.threshold
+        if mask.any():
+            # 只更新变化块：未超过阈值的缓慢变化继续与上次发送的画面比较，累积到阈值后仍会被发送，
+            # 不会被悄悄吸收进参考帧而让客户端拼出的画面一直停在旧内容上
+            changed = np.repeat(np.repeat(mask, self.block, axis=0), self.block, axis=1)[:h, :w]
+            np.copyto(self.previous, frame, where=changed[..., None] if frame.ndim == 3 else changed)
+        return mask
+
+
+def dirty_regions(mask, shape, block=BLOCK):
+    """把变化块合并为若干矩形 (x, y, w, h)，坐标为像素并裁剪到画面内"""
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    height, width = shape[:2]
+    regions = []
+    for x, y, w, h, _ in stats[1:count]:
+        x0, y0 = x * block, y * block
+        regions.append((int(x0), int(y0), int(min(w * block, width - x0)), int(min(h * block, height - y0))))
+    return regions
+
+
+def grab(sct, monitor):
+    """截取屏幕（包含鼠标光标），返回直接引用 mss 缓冲区的 BGRA 视图，不做拷贝"""
+    shot = sct.grab(monitor, include_cursor=True)
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+
+def encode(frame, quality=QUALITY):
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
+
+
+def mjpeg_part(frame_bytes, headers=b''):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n' + headers + b'\r\n' + frame_bytes + b'\r\n')
+
+
+class Pacer:
+    """自适应帧率：有变化时以 FPS 采样，静止时逐渐降到 MIN_FPS"""
+    def __init__(self):
+        self.fps = FPS
+
+    def update(self, changed):
+        self.fps = FPS if changed else max(MIN_FPS, self.fps * 0.8)
+
+    def sleep(self, start_time):
+        process_time = time.time() - start_time
+        time.sleep(max(0, (1.0 / self.fps) - process_time))
+
+
+class Variant:
+    """一种输出规格（缩放比例 + JPEG 质量）的最新编码结果，以及转换用的复用缓冲区"""
+    def __init__(self, scale, quality):
+        self.scale = scale
+        self.quality = quality
+        self.subscribers = 0
+        self.tile_subscribers = 0
+        self.seq = 0  # 最近一次更新时的帧序号
+        self.jpeg = None  # 最新的整帧 JPEG
+        self.tiles = []  # 相对上一帧的变化区域 [(x, y, w, h, jpeg)]，仅在有分块订阅者时编码
+        self.size = None  # (宽, 高)
+        self._resized = None
+        self._bgr = None
+
+    def convert(self, bgra):
+        """缩放并转换为 BGR，结果写入复用的缓冲区，下一帧会被覆盖"""
+        h, w = bgra.shape[:2]
+        size = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+        if size != (w, h):
+            # 先在 BGRA 上缩小，颜色转换只需处理缩小后的像素
+            if self._resized is None or self._resized.shape[:2] != (size[1], size[0]):
+                self._resized = np.empty((size[1], size[0], 4), dtype=np.uint8)
+            cv2.resize(bgra, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+            bgra = self._resized
+        if self._bgr is None or self._bgr.shape[:2] != bgra.shape[:2]:
+            self._bgr = np.empty(bgra.shape[:2] + (3,), dtype=np.uint8)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._bgr)
+        return self._bgr
+
+    def encode(self, bgra, mask):
+        """返回 (jpeg, tiles, size)，整帧编码失败时 jpeg 为 None"""
+        frame = self.convert(bgra)
+        jpeg = encode(frame, self.quality)
+        tiles = encode_tiles(frame, mask, bgra.shape, self.scale, self.quality) if self.tile_subscribers else []
+        return jpeg, tiles, (frame.shape[1], frame.shape[0])
+
+
+class CaptureHub:
+    """
+    所有客户端共享一个后台线程：截屏、变化检测与编码每帧只做一次，最新结果带序号发布给所有订阅者。
+    不同的缩放比例 / JPEG 质量各编码一份，相同参数的客户端共用。
+    订阅者每次只取最新的一帧，处理不过来的客户端会跳帧，而不会拖慢采集或其他客户端。
+    没有订阅者时后台线程停止截屏。
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._thread = None
+        self._reset = False
+        self.seq = 0
+        self.variants = {}  # (scale, quality) -> Variant
+
+    def subscribe(self, scale=1.0, quality=QUALITY, tiles=False):
+        with self._cond:
+            variant = self.variants.get((scale, quality))
+            if variant is None:
+                variant = self.variants[(scale, quality)] = Variant(scale, quality)
+                # 新规格还没有编码结果，下一次截屏按整帧变化处理
+                self._reset = True
+            variant.subscribers += 1
+            variant.tile_subscribers += tiles
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return variant
+
+    def unsubscribe(self, variant, tiles=False):
+        with self._cond:
+            variant.subscribers -= 1
+            variant.tile_subscribers -= tiles
+            if variant.subscribers == 0:
+                del self.variants[(variant.scale, variant.quality)]
+
+    def wait(self, variant, after_seq, timeout):
+        """等待序号大于 after_seq 的帧，超时则返回当前最新帧；返回 (seq, jpeg, tiles, size)"""
+        with self._cond:
+            self._cond.wait_for(lambda: variant.seq > after_seq, timeout)
+            return variant.seq, variant.jpeg, variant.tiles, variant.size
+
+    def _run(self):
+        """截屏或编码出错时记录错误并重新打开截屏，线程不会因此退出而让所有订阅者停在旧画面上"""
+        try:
+            while True:
+                try:
+                    self._capture()
+                except Exception as e:
+                    print(f"Capture error, retrying in 1s: {e!r}")
+                    time.sleep(1)
+        finally:
+            with self._cond:
+                self._thread = None
+
+    def _capture(self):
+        detector = ChangeDetector()
+        pacer = Pacer()
+        with mss.mss() as sct:
+            # 获取第一块显示器
+            monitor = sct.monitors[1]
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.variants)
+                    if self._reset:
+                        detector = ChangeDetector()
+                        self._reset = False
+                    variants = list(self.variants.values())
+
+                start_time = time.time()
+                # 直接在 BGRA 视图上做变化检测，画面没变时不需要任何转换
+                bgra = grab(sct, monitor)
+                mask = detector.update(bgra)
+                changed = mask.any()
+                pacer.update(changed)
+                if changed:
+                    results = [(variant, variant.encode(bgra, mask)) for variant in variants]
+                    with self._cond:
+                        self.seq += 1
+                        for variant, (jpeg, tiles, size) in results:
+                            if jpeg is not None:
+                                variant.seq, variant.jpeg, variant.tiles, variant.size = self.seq, jpeg, tiles, size
+                        self._cond.notify_all()
+                pacer.sleep(start_time)
+
+
+def encode_tiles(frame, mask, shape, scale=1.0, quality=QUALITY):
+    """按原始分辨率 shape 求出变化区域，换算到缩放后的 frame 上分别编码"""
+    regions = dirty_regions(mask, shape)
+    if mask.all() or len(regions) > MAX_REGIONS:
+        return []
+    height, width = frame.shape[:2]
+    tiles = []
+    for x, y, w, h in regions:
+        # 向外取整，保证缩放后的分块完整覆盖变化区域
+        x0, y0 = int(x * scale), int(y * scale)
+        x1, y1 = min(width, math.ceil((x + w) * scale)), min(height, math.ceil((y + h) * scale))
+        tile_bytes = encode(frame[y0:y1, x0:x1], quality)
+        if tile_bytes is None:
+            return []
+        tiles.append((x0, y0, x1 - x0, y1 - y0, tile_bytes))
+    return tiles
+
+
+hub = CaptureHub()
+
+
+def nearest(value, steps):
+    return min(steps, key=lambda step: abs(step - value))
+
+
+def stream_options():
+    """
+    从查询参数读取每个客户端的输出规格：?quality=50&scale=0.5&fps=5
+    缩放比例与 JPEG 质量取最接近的档位，每帧最多编码 len(SCALES) * len(QUALITIES) 份，
+    参数各不相同的客户端不会让采集线程为每个人单独编码一份
+    """
+    quality = nearest(request.args.get('quality', QUALITY, type=int), QUALITIES)
+    scale = nearest(request.args.get('scale', 1.0, type=float), SCALES)
+    fps = min(FPS, max(0.5, request.args.get('fps', FPS, type=float)))
+    return scale, quality, fps
+
+
+def generate_frames(scale=1.0, quality=QUALITY, fps=FPS):
+    variant = hub.subscribe(scale, quality)
+    try:
+        seq = 0
+        while True:
+            start_time = time.time()
+            # 画面静止时 wait 超时，重发上一帧作为 keep-alive
+            seq, jpeg, _, _ = hub.wait(variant, seq, KEEPALIVE)
+            if jpeg is not None:
+                # 使用 MJPEG 格式输出
+                yield mjpeg_part(jpeg)
+            # 限制该客户端的帧率，期间到达的帧直接跳过
+            time.sleep(max(0, 1.0 / fps - (time.time() - start_time)))
+    finally:
+        hub.unsubscribe(variant)
+
+
+def generate_tiles(scale=1.0, quality=QUALITY, fps=FPS):
+    """
+    分块模式：第一帧发送整幅画面，之后只发送变化区域的 JPEG，
+    每个分块带 X-Region: x,y,w,h 头（缩放后的坐标），客户端把它贴回自己保存的画面上。
+    客户端跳过了中间的帧（包括被 fps 限制跳过）、或变化区域过多时发送整帧；
+    画面静止时按 KEEPALIVE 间隔发送不含图像的 X-Keepalive 分块。
+    """
+    variant = hub.subscribe(scale, quality, tiles=True)
+    try:
+        seq = 0
         while True:
             start_time = time.time()
-            
-            # 截取屏幕，包含鼠标光标
-            img = np.array(sct.grab(monitor, include_cursor=True))
-            
-            # mss 抓取的是 BGRA，转换为 BGR 供 OpenCV 使用
-            frame = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            
-            # 如果屏幕太大，可以考虑缩放以降低带宽
-            # frame = cv2.resize(frame, (1280, 720))
-
-            # 编码为 JPEG
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])
-            if not ret:
+            new_seq, jpeg, tiles, size = hub.wait(variant, seq, KEEPALIVE)
+            if new_seq == seq or jpeg is None:
+                yield b'--frame\r\nContent-Type: text/plain\r\nX-Keepalive: 1\r\n\r\n\r\n'
                 continue
-                
-            frame_bytes = buffer.tobytes()
-            
-            # 使用 MJPEG 格式输出
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            # 控制帧率
-            process_time = time.time() - start_time
-            sleep_time = max(0, (1.0 / FPS) - process_time)
-            time.sleep(sleep_time)
+            if new_seq != seq + 1 or seq == 0 or not tiles:
+                tiles = [(0, 0, size[0], size[1], jpeg)]
+            for x, y, w, h, tile_bytes in tiles:
+                yield mjpeg_part(tile_bytes, f'X-Region: {x},{y},{w},{h}\r\n'.encode())
+            seq = new_seq
+            time.sleep(max(0, 1.0 / fps - (time.time() - start_time)))
+    finally:
+        hub.unsubscribe(variant, tiles=True)
+
 
 @app.route('/stream')
 def video_feed():
-    """MJPEG 视频流路由"""
-    return Response(generate_frames(),
+    """MJPEG 视频流路由，支持 quality / scale / fps 查询参数"""
+    return Response(generate_frames(*stream_options()),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/tiles')
+def tiles_feed():
+    """只传输变化区域的分块流，适用于自行拼接画面的客户端，查询参数同 /stream"""
+    return Response(generate_tiles(*stream_options()),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/')
 def index():
-    return "Screen Streamer is Running. Access /stream for MJPEG."
+    return "Screen Streamer is Running. Access /stream for MJPEG, /tiles for changed regions only (optional ?quality=&scale=&fps=)."
 
 if __name__ == '__main__':
     # 启动服务器。注意：由于是屏幕共享，默认只监听本地。
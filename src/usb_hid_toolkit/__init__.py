@@ -1,46 +1,37 @@
-from .keyboard import Keyboard
-from .mouse import Mouse
-from .transmitters import BaseTransmitter
-from .packets import KeyboardPacket, MousePacket
-
-class USBHidClient:
-    def __init__(self, transmitter: BaseTransmitter):
-        self.transmitter = transmitter
-        self.keyboard = Keyboard(transmitter)
-        self.mouse = Mouse(transmitter)
-
-    def send_packet(self, packet_obj):
-        """
-        发送一个预先构造好的数据包对象 (KeyboardPacket 或 MousePacket)
-        """
-        raw_bytes = packet_obj.build()
-        self.transmitter.send(raw_bytes)
-
-    def close(self):
-        self.transmitter.close()
-
-class USBHidManager:
-    """
-    管理多个 HID 设备（客户端）。
-    """
-    def __init__(self):
-        self._devices = {}
-
-    def add_device(self, name: str, client: USBHidClient):
-        self._devices[name] = client
-
-    def get_device(self, name: str) -> USBHidClient:
-        return self._devices.get(name)
-
-    def remove_device(self, name: str):
-        if name in self._devices:
-            self._devices[name].close()
-            del self._devices[name]
-
-    def all_devices(self):
-        return self._devices.values()
-
-    def broadcast_keyboard_tap(self, key):
-        """向所有设备发送同一个按键指令"""
-        for device in self._devices.values():
-            device.keyboard.tap(key)
+"""
+usb_hid_toolkit 的公开接口按需加载：`import usb_hid_toolkit` 本身不会导入任何子模块，
+首次访问 USBHidClient 等属性时才导入对应模块，保证命令行等一次性调用的启动开销最小。
+"""
+__all__ = [
+    'USBHidClient', 'USBHidManager', 'Keyboard', 'Mouse', 'BaseTransmitter',
+    'KeyboardPacket', 'MousePacket', 'UnknownKeyError', 'resolve_key',
+    'UnknownLayoutError', 'register_layout',
+]
+
+# 公开属性 -> 定义它的子模块
+_LAZY_ATTRS = {
+    'USBHidClient': 'client',
+    'USBHidManager': 'client',
+    'Keyboard': 'keyboard',
+    'Mouse': 'mouse',
+    'BaseTransmitter': 'transmitters.base',
+    'KeyboardPacket': 'packets',
+    'MousePacket': 'packets',
+    'UnknownKeyError': 'keys',
+    'resolve_key': 'keys',
+    'UnknownLayoutError': 'layouts',
+    'register_layout': 'layouts',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(__import__(module, globals(), level=1, fromlist=[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
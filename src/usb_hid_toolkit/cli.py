@@ -0,0 +1,265 @@
+"""
+usb-hid 命令行工具。
+
+    usb-hid --host 192.168.2.239 tap ctrl+c
+    usb-hid type "hello world"
+    usb-hid move 100 -50
+    usb-hid click right
+    usb-hid replay actions.txt
+    usb-hid bench --count 500 move 1 0
+
+如果本地守护进程 (`usb-hid daemon`) 正在运行，命令通过 Unix domain socket 转发给它执行，
+守护进程常驻并保持设备客户端与按键状态，省去每次启动解释器后建立客户端的开销；
+否则直接在当前进程中执行。本模块顶层只导入标准库的轻量模块，转发路径不会加载工具包的其他部分。
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import stat
+import sys
+import tempfile
+import time
+
+DEFAULT_PORT = 80
+
+
+def default_socket_path():
+    path = os.environ.get("USB_HID_SOCKET")
+    if path:
+        return path
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, f"usb-hid-{uid}.sock")
+    # 没有 XDG_RUNTIME_DIR 时放在只有当前用户可访问的私有目录中，由守护进程以 0700 创建
+    return os.path.join(tempfile.gettempdir(), f"usb-hid-{uid}", "daemon.sock")
+
+
+def trusted_socket_dir(directory):
+    """
+    目录只有当前用户能写入（属于当前用户且组/其他用户不可写），或是 root/当前用户所有、
+    设置了粘滞位的公共目录（如 /tmp）：其他用户都无法替换其中属于当前用户的套接字。
+    """
+    if not hasattr(os, "getuid"):
+        return True
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return False
+    if st.st_uid not in (0, os.getuid()):
+        return False
+    if st.st_mode & stat.S_ISVTX:
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def socket_owned_by_user(path):
+    """path 是当前用户创建的套接字，且所在目录可信；否则不能把按键发给它"""
+    if not hasattr(os, "getuid"):
+        return True
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return (stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+            and trusted_socket_dir(os.path.dirname(os.path.abspath(path))))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="usb-hid", description="Send USB HID keyboard/mouse commands to remote hardware.")
+    parser.add_argument("--host", default=os.environ.get("USB_HID_HOST"), help="Device address (env: USB_HID_HOST)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("USB_HID_PORT", DEFAULT_PORT)), help="Device port (env: USB_HID_PORT)")
+    parser.add_argument("--layout", default=os.environ.get("USB_HID_LAYOUT", "us"), help="Target keyboard layout (env: USB_HID_LAYOUT)")
+    parser.add_argument("--socket", default=default_socket_path(), help="Daemon socket path (env: USB_HID_SOCKET)")
+    parser.add_argument("--no-daemon", action="store_true", help="Always execute in this process")
+
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    _add_action_parsers(sub)
+
+    replay = sub.add_parser("replay", help="Run commands from a file ('-' for stdin), one per line")
+    replay.add_argument("file")
+
+    bench = sub.add_parser("bench", help="Measure command throughput and latency")
+    bench.add_argument("--count", type=int, default=200)
+    bench.add_argument("action", nargs=argparse.REMAINDER, help="Command to repeat (default: move 1 0)")
+
+    sub.add_parser("daemon", help="Run the local daemon in the foreground")
+    return parser
+
+
+def _add_action_parsers(sub):
+    tap = sub.add_parser("tap", help="Tap one or more keys or chords, e.g. 'ctrl+c'")
+    tap.add_argument("keys", nargs="+")
+    tap.add_argument("--delay", type=float, default=0.01)
+
+    type_ = sub.add_parser("type", help="Type text using the target layout")
+    type_.add_argument("text")
+    type_.add_argument("--interval", type=float, default=0.0)
+
+    move = sub.add_parser("move", help="Move the mouse relatively")
+    move.add_argument("x", type=int)
+    move.add_argument("y", type=int)
+    move.add_argument("--wheel", type=int, default=0)
+
+    click = sub.add_parser("click", help="Click a mouse button")
+    click.add_argument("button", nargs="?", default="left", choices=["left", "right", "middle"])
+    click.add_argument("--count", type=int, default=1)
+
+    sleep = sub.add_parser("sleep", help="Pause (useful in replay files)")
+    sleep.add_argument("seconds", type=float)
+
+
+def _action_parser():
+    parser = argparse.ArgumentParser(prog="usb-hid", add_help=False)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    _add_action_parsers(sub)
+    return parser
+
+
+def to_command(args):
+    """argparse 结果 -> 可序列化的命令字典"""
+    command = dict(vars(args))
+    for key in ("host", "port", "layout", "socket", "no_daemon"):
+        command.pop(key, None)
+    return command
+
+
+def execute(client, command):
+    """在给定的 USBHidClient 上执行一条命令"""
+    cmd = command["cmd"]
+    if cmd == "tap":
+        for key in command["keys"]:
+            client.keyboard.tap(key, delay=command.get("delay", 0.01))
+    elif cmd == "type":
+        client.keyboard.type_text(command["text"], interval=command.get("interval", 0.0))
+    elif cmd == "move":
+        client.mouse.move(x=command["x"], y=command["y"], wheel=command.get("wheel", 0))
+    elif cmd == "click":
+        for _ in range(command.get("count", 1)):
+            client.mouse.click(command.get("button", "left"))
+    elif cmd == "sleep":
+        time.sleep(command["seconds"])
+    else:
+        raise ValueError(f"Unknown command: {cmd}")
+
+
+class DirectRunner:
+    """在当前进程中执行命令"""
+    def __init__(self, host, port, layout):
+        if not host:
+            raise SystemExit("usb-hid: no device address, pass --host or set USB_HID_HOST")
+        from .client import USBHidClient
+        from .transmitters.tcp import TCPTransmitter
+        self.client = USBHidClient(TCPTransmitter(host=host, port=port), layout=layout)
+
+    def run(self, command):
+        execute(self.client, command)
+
+    def close(self):
+        self.client.close()
+
+
+class DaemonRunner:
+    """通过 Unix domain socket 把命令转发给守护进程"""
+    def __init__(self, sock, host, port, layout):
+        self.sock = sock
+        self.device = {"host": host, "port": port, "layout": layout}
+        self.reader = sock.makefile("rb")
+
+    @classmethod
+    def connect(cls, path, host, port, layout):
+        if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+            return None
+        if not socket_owned_by_user(path):
+            print(f"usb-hid: ignoring daemon socket {path}: not owned by this user or in a shared directory", file=sys.stderr)
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock, host, port, layout)
+
+    def run(self, command):
+        message = dict(command, device=self.device)
+        self.sock.sendall(json.dumps(message).encode() + b"\n")
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("usb-hid daemon closed the connection")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "daemon error"))
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def open_runner(args):
+    if not args.no_daemon:
+        runner = DaemonRunner.connect(args.socket, args.host, args.port, args.layout)
+        if runner is not None:
+            return runner
+    return DirectRunner(args.host, args.port, args.layout)
+
+
+def read_replay(path):
+    """读取回放文件：每行一条命令，语法与命令行相同，'#' 开头为注释"""
+    parser = _action_parser()
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in stream:
+            argv = shlex.split(line, comments=True)
+            if argv:
+                yield to_command(parser.parse_args(argv))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_bench(runner, args):
+    argv = args.action or ["move", "1", "0"]
+    command = to_command(_action_parser().parse_args(argv))
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.count):
+        t0 = time.perf_counter()
+        runner.run(command)
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    latencies.sort()
+    mode = "daemon" if isinstance(runner, DaemonRunner) else "direct"
+    print(f"{args.count} x {' '.join(argv)} via {mode}: {args.count / total:.1f} cmd/s")
+    print(f"latency p50={latencies[len(latencies) // 2] * 1000:.2f} ms "
+          f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f} ms")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.cmd == "daemon":
+        from .daemon import serve
+        serve(args.socket)
+        return 0
+
+    runner = open_runner(args)
+    try:
+        if args.cmd == "replay":
+            for command in read_replay(args.file):
+                runner.run(command)
+        elif args.cmd == "bench":
+            run_bench(runner, args)
+        else:
+            runner.run(to_command(args))
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"usb-hid: {e}", file=sys.stderr)
+        return 1
+    finally:
+        runner.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
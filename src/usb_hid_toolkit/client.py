@@ -0,0 +1,60 @@
+from .keyboard import Keyboard
+from .mouse import Mouse
+from .transmitters.base import BaseTransmitter
+from .packets import KeyboardPacket, MousePacket
+
+class USBHidClient:
+    def __init__(self, transmitter: BaseTransmitter, resync_interval=None, layout='us'):
+        """
+        resync_interval: 状态未变化时也定期重发状态包的间隔（秒），None 表示只发送变化的状态。
+        layout: 目标机的键盘布局，例如 'us'、'fr'、'de'。
+        """
+        self.transmitter = transmitter
+        self.keyboard = Keyboard(transmitter, resync_interval=resync_interval, layout=layout)
+        self.mouse = Mouse(transmitter, resync_interval=resync_interval)
+
+    def send_packet(self, packet_obj):
+        """
+        发送一个预先构造好的数据包对象 (KeyboardPacket 或 MousePacket)
+        """
+        raw_bytes = packet_obj.build()
+        self.transmitter.send(raw_bytes)
+        # 绕过了 keyboard/mouse 的状态跟踪，下一次状态包必须重新发出
+        if isinstance(packet_obj, KeyboardPacket):
+            self.keyboard.invalidate()
+        elif isinstance(packet_obj, MousePacket):
+            self.mouse.invalidate()
+
+    def sync(self):
+        """无条件重发键盘与鼠标的当前状态"""
+        self.keyboard.sync()
+        self.mouse.sync()
+
+    def close(self):
+        self.transmitter.close()
+
+class USBHidManager:
+    """
+    管理多个 HID 设备（客户端）。
+    """
+    def __init__(self):
+        self._devices = {}
+
+    def add_device(self, name: str, client: USBHidClient):
+        self._devices[name] = client
+
+    def get_device(self, name: str) -> USBHidClient:
+        return self._devices.get(name)
+
+    def remove_device(self, name: str):
+        if name in self._devices:
+            self._devices[name].close()
+            del self._devices[name]
+
+    def all_devices(self):
+        return self._devices.values()
+
+    def broadcast_keyboard_tap(self, key):
+        """向所有设备发送同一个按键指令"""
+        for device in self._devices.values():
+            device.keyboard.tap(key)
@@ -16,10 +16,13 @@ KEYBOARD_CODES = {
     # 功能键
     'f1': 0x3A, 'f2': 0x3B, 'f3': 0x3C, 'f4': 0x3D, 'f5': 0x3E, 'f6': 0x3F,
     'f7': 0x40, 'f8': 0x41, 'f9': 0x42, 'f10': 0x43, 'f11': 0x44, 'f12': 0x45,
+    'f13': 0x68, 'f14': 0x69, 'f15': 0x6A, 'f16': 0x6B, 'f17': 0x6C, 'f18': 0x6D,
+    'f19': 0x6E, 'f20': 0x6F, 'f21': 0x70, 'f22': 0x71, 'f23': 0x72, 'f24': 0x73,
 
     # 控制键
     'enter': 0x28, 'esc': 0x29, 'backspace': 0x2A, 'tab': 0x2B, 'space': 0x2C,
-    'caps_lock': 0x39,
+    'caps_lock': 0x39, 'print_screen': 0x46, 'scroll_lock': 0x47, 'pause': 0x48,
+    'application': 0x65, 'power': 0x66,
 
     # 修饰键
     'left_ctrl': 0xE0, 'left_shift': 0xE1, 'left_alt': 0xE2, 'left_gui': 0xE3,
@@ -28,11 +31,50 @@ KEYBOARD_CODES = {
     # 方向键
     'up': 0x52, 'down': 0x51, 'left': 0x50, 'right': 0x4F,
 
+    # 编辑/导航键
+    'insert': 0x49, 'home': 0x4A, 'page_up': 0x4B,
+    'delete': 0x4C, 'end': 0x4D, 'page_down': 0x4E,
+
+    # 小键盘
+    'num_lock': 0x53, 'kp_divide': 0x54, 'kp_multiply': 0x55, 'kp_minus': 0x56,
+    'kp_plus': 0x57, 'kp_enter': 0x58,
+    'kp_1': 0x59, 'kp_2': 0x5A, 'kp_3': 0x5B, 'kp_4': 0x5C, 'kp_5': 0x5D,
+    'kp_6': 0x5E, 'kp_7': 0x5F, 'kp_8': 0x60, 'kp_9': 0x61, 'kp_0': 0x62,
+    'kp_decimal': 0x63, 'kp_equal': 0x67, 'kp_comma': 0x85,
+
+    # 多媒体（键盘用途页，Consumer 用途页的播放控制不在此协议的键盘报文中）
+    'mute': 0x7F, 'volume_up': 0x80, 'volume_down': 0x81,
+
+    # 国际键
+    'non_us_hash': 0x32, 'non_us_backslash': 0x64,
+    'intl_ro': 0x87, 'katakana_hiragana': 0x88, 'intl_yen': 0x89,
+    'henkan': 0x8A, 'muhenkan': 0x8B,
+    'lang1': 0x90, 'lang2': 0x91, 'lang3': 0x92, 'lang4': 0x93, 'lang5': 0x94,
+
     # 其他
     '-': 0x2D, '=': 0x2E, '[': 0x2F, ']': 0x30, '\\': 0x31, ';': 0x33,
     "'": 0x34, '`': 0x35, ',': 0x36, '.': 0x37, '/': 0x38,
 }
 
+# 按键别名，均映射到 KEYBOARD_CODES 中的标准名称（名称匹配不区分大小写）
+KEY_ALIASES = {
+    'ctrl': 'left_ctrl', 'control': 'left_ctrl', 'lctrl': 'left_ctrl', 'rctrl': 'right_ctrl',
+    'shift': 'left_shift', 'lshift': 'left_shift', 'rshift': 'right_shift',
+    'alt': 'left_alt', 'lalt': 'left_alt', 'ralt': 'right_alt', 'altgr': 'right_alt',
+    'option': 'left_alt',
+    'gui': 'left_gui', 'win': 'left_gui', 'windows': 'left_gui', 'super': 'left_gui',
+    'meta': 'left_gui', 'cmd': 'left_gui', 'command': 'left_gui',
+    'return': 'enter', 'escape': 'esc', 'bksp': 'backspace', 'del': 'delete',
+    'ins': 'insert', 'pgup': 'page_up', 'pageup': 'page_up', 'pgdn': 'page_down',
+    'pagedown': 'page_down', 'spacebar': 'space', 'capslock': 'caps_lock',
+    'prtsc': 'print_screen', 'printscreen': 'print_screen', 'scrolllock': 'scroll_lock',
+    'break': 'pause', 'menu': 'application', 'apps': 'application', 'numlock': 'num_lock',
+    'arrow_up': 'up', 'arrow_down': 'down', 'arrow_left': 'left', 'arrow_right': 'right',
+    'hangul': 'lang1', 'hanja': 'lang2', 'minus': '-',
+    # 控制字符
+    '\n': 'enter', '\r': 'enter', '\t': 'tab', ' ': 'space', '\b': 'backspace', '\x1b': 'esc',
+}
+
 # Mouse actions mapping to internal codes (compatible with original project)
 MOUSE_ACTIONS = {
     "left_click": -1,
@@ -0,0 +1,100 @@
+"""
+usb-hid 本地守护进程：监听 Unix domain socket，每行接收一条 JSON 命令并返回一行 JSON 结果。
+每个设备 (host, port, layout) 只创建一个 USBHidClient 并常驻，按键状态与去重记录在多次调用之间保持。
+"""
+import json
+import os
+import signal
+import socketserver
+import stat
+import threading
+
+from .cli import execute, trusted_socket_dir
+from .client import USBHidClient
+from .transmitters.tcp import TCPTransmitter
+
+
+class HIDDaemon:
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, device):
+        key = (device.get("host"), device.get("port", 80), device.get("layout", "us"))
+        if not key[0]:
+            raise ValueError("no device address, pass --host or set USB_HID_HOST")
+        client = self._clients.get(key)
+        if client is None:
+            client = USBHidClient(TCPTransmitter(host=key[0], port=key[1]), layout=key[2])
+            self._clients[key] = client
+        return client
+
+    def handle(self, command):
+        # 同一时间只执行一条命令，避免多个调用方交错修改按键状态
+        with self._lock:
+            execute(self.get_client(command.pop("device", {})), command)
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                self.server.daemon_state.handle(json.loads(line))
+                reply = {"ok": True}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _prepare_socket_path(path):
+    """创建私有目录 (0700)，并只清理当前用户遗留的旧套接字"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700)
+    if not trusted_socket_dir(directory):
+        raise SystemExit(f"usb-hid: refusing to listen in {directory}: it is writable by other users")
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode) or (hasattr(os, "getuid") and st.st_uid != os.getuid()):
+        raise SystemExit(f"usb-hid: refusing to replace {path}: not a socket owned by this user")
+    os.unlink(path)
+
+
+def serve(path):
+    """在前台运行守护进程，直到收到 Ctrl+C 或 SIGTERM"""
+    _prepare_socket_path(path)
+    state = HIDDaemon()
+    # bind 时套接字即为 0600，不存在其他用户可以连接的窗口
+    umask = os.umask(0o177)
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(umask)
+    server.daemon_state = state
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"usb-hid daemon listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.close()
+        if os.path.exists(path):
+            os.unlink(path)
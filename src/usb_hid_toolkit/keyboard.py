@@ -1,36 +1,61 @@
 import time
-from .constants import KEYBOARD_CODES
+from .keys import MODIFIER_CODES, UnknownKeyError, resolve_key
+from .layouts import get_layout
 from .protocol import build_keyboard_packet
 
 class Keyboard:
-    def __init__(self, transmitter):
+    def __init__(self, transmitter, resync_interval=None, layout='us'):
+        """
+        resync_interval: 状态未变化时也强制重发的最小间隔（秒），None 表示只在状态变化时发送。
+        layout: 目标机的键盘布局（'us'、'fr'/'azerty'、'de'/'qwertz'），决定字符到按键的映射。
+        """
         self.transmitter = transmitter
+        self.resync_interval = resync_interval
+        self.layout = layout
         self._current_keys = []
+        # 修饰键 -> 按下它的组合（codes），只有全部组合都松开后修饰键才松开
+        self._modifier_owners = {}
+        self._last_report = None
+        self._last_sent_at = 0.0
 
-    def press(self, key):
-        """按下按键（不松开）。支持组合键，例如先 press('left_ctrl') 再 press('c')"""
-        if key in KEYBOARD_CODES:
-            code = KEYBOARD_CODES[key]
+    def press(self, key, force=False):
+        """
+        按下按键（不松开）。支持组合键，例如先 press('left_ctrl') 再 press('c')，
+        也可以直接 press('ctrl+c')。无法识别的按键会抛出 UnknownKeyError。
+        """
+        codes = resolve_key(key, self.layout).codes
+        for code in codes:
+            if code in MODIFIER_CODES:
+                self._modifier_owners.setdefault(code, set()).add(codes)
             if code not in self._current_keys:
                 if len(self._current_keys) >= 6: # HID standard: max 6 keys
-                    self._current_keys.pop(0)
+                    self._modifier_owners.pop(self._current_keys.pop(0), None)
                 self._current_keys.append(code)
-            self._send_status()
-        else:
-            print(f"Unknown key: {key}")
-
-    def release(self, key):
-        """松开特定按键"""
-        if key in KEYBOARD_CODES:
-            code = KEYBOARD_CODES[key]
+        self._send_status(force)
+
+    def release(self, key, force=False):
+        """
+        松开特定按键。组合键会松开其中的普通按键，以及只由该组合按下的修饰键，
+        例如单独按住 Shift 后 release('A') 不会松开 Shift；直接松开修饰键本身则总是松开。
+        """
+        codes = resolve_key(key, self.layout).codes
+        for code in codes:
+            if code in MODIFIER_CODES and len(codes) > 1:
+                owners = self._modifier_owners.get(code)
+                if owners:
+                    owners.discard(codes)
+                    if owners:
+                        continue
+            self._modifier_owners.pop(code, None)
             if code in self._current_keys:
                 self._current_keys.remove(code)
-            self._send_status()
+        self._send_status(force)
 
-    def release_all(self):
+    def release_all(self, force=False):
         """松开所有按键"""
         self._current_keys = []
-        self._send_status()
+        self._modifier_owners.clear()
+        self._send_status(force)
 
     def tap(self, key, delay=0.01):
         """按下并松开一个按键"""
@@ -40,7 +65,7 @@ class Keyboard:
 
     def hotkey(self, *keys, delay=0.01):
         """
-        触发快捷键组合，例如 hotkey('left_ctrl', 'c')
+        触发快捷键组合，例如 hotkey('left_ctrl', 'c')，等价于 tap('ctrl+c')
         """
         for k in keys:
             self.press(k)
@@ -48,6 +73,51 @@ class Keyboard:
         for k in reversed(keys):
             self.release(k)
 
-    def _send_status(self):
+    def type_text(self, text, delay=0.01, interval=0.0):
+        """
+        按当前布局输入一段文本，必要时自动使用 Shift/AltGr 与死键。
+        delay: 每次按下与松开之间的间隔；interval: 相邻字符之间的额外间隔。
+        含有当前布局无法输入的字符时抛出 UnknownKeyError，此时不会输入任何字符。
+        """
+        table = get_layout(self.layout)
+        for char in text:
+            if char not in table:
+                raise UnknownKeyError(f"Character {char!r} cannot be typed with layout {self.layout!r}")
+        for char in text:
+            for codes in table[char]:
+                self._tap_codes(codes, delay)
+            if interval:
+                time.sleep(interval)
+
+    def sync(self):
+        """无条件重发当前按键状态，用于纠正设备端可能丢失的状态"""
+        self._send_status(force=True)
+
+    def invalidate(self):
+        """丢弃已发送状态的记录（例如绕过本对象直接发送了数据包），下一次状态包必定发出"""
+        self._last_report = None
+
+    def _tap_codes(self, codes, delay):
+        added = [code for code in codes if code not in self._current_keys]
+        self._current_keys.extend(added)
+        del self._current_keys[:-6] # HID standard: max 6 keys
+        self._send_status()
+        time.sleep(delay)
+        for code in added:
+            if code in self._current_keys:
+                self._current_keys.remove(code)
+        self._send_status()
+
+    def _send_status(self, force=False):
         packet = build_keyboard_packet(self._current_keys)
-        self.transmitter.send(packet)
+        now = time.monotonic()
+        if not force and packet == self._last_report:
+            # 与上一次发送的报文相同，设备端状态无需更新
+            if self.resync_interval is None or now - self._last_sent_at < self.resync_interval:
+                return
+        if self.transmitter.send(packet) is False:
+            # 发送失败时设备端状态未知，下一次状态包必须重新发出
+            self._last_report = None
+            return
+        self._last_report = packet
+        self._last_sent_at = now
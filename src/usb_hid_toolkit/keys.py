@@ -0,0 +1,139 @@
+"""
+按键名称解析：别名、大小写、组合键字符串（如 "Ctrl+Shift+T"）统一编译为 Chord，
+编译结果按布局和原始名称缓存，重复解析只需一次字典查找。
+单个字符按键盘布局解析，例如 AZERTY 布局下的 'a' 对应 US 布局中 'q' 的位置；
+组合键中的字符只取其所在的物理按键，不附加 Shift/AltGr。
+"""
+from .constants import KEYBOARD_CODES, KEY_ALIASES
+from .layouts import char_strokes
+
+MODIFIER_CODES = frozenset(range(0xE0, 0xE8))
+
+# HID 键盘报文最多同时携带 6 个按键
+MAX_KEYS = 6
+
+_CACHE_LIMIT = 4096
+
+
+class UnknownKeyError(ValueError):
+    """无法解析的按键名称"""
+
+
+class Chord:
+    """
+    一个或多个同时按下的按键。
+    codes: 按键扫描码（修饰键在前）
+    """
+    __slots__ = ('name', 'codes')
+
+    def __init__(self, name, codes):
+        self.name = name
+        self.codes = codes
+
+    def __repr__(self):
+        return f"Chord({self.name!r}, codes={[hex(c) for c in self.codes]})"
+
+
+_chords = {}
+
+
+def resolve_key(name, layout='us'):
+    """
+    将按键名称解析为 Chord。支持：
+    - 标准名称及别名，不区分大小写：'enter'、'Return'、'ctrl'
+    - 单个字符（按 layout 解析）：'a'、'A'、'!'、'\\n'
+    - 组合键字符串：'Ctrl+Shift+T'、'ctrl++'
+    无法解析时抛出 UnknownKeyError。需要死键的字符请使用 Keyboard.type_text()。
+    """
+    if not isinstance(name, str) or not name:
+        raise UnknownKeyError(f"Unknown key: {name!r}")
+    cache = _chords.get(layout)
+    if cache is None:
+        cache = _chords[layout] = {}
+    chord = cache.get(name)
+    if chord is None:
+        chord = Chord(name, _compile(name, layout))
+        if len(cache) >= _CACHE_LIMIT:
+            cache.clear()
+        cache[name] = chord
+    return chord
+
+
+def _compile(name, layout):
+    if len(name) == 1:
+        return _char_codes(name, layout)
+    code = _named_code(name)
+    if code is not None:
+        return (code,)
+    if '+' in name:
+        return _chord_codes(name, layout)
+    raise UnknownKeyError(f"Unknown key: {name!r}")
+
+
+def _named_code(name):
+    """多字符按键名称 -> 扫描码，找不到时返回 None"""
+    normalized = name.strip().lower().replace(' ', '_').replace('-', '_')
+    normalized = KEY_ALIASES.get(normalized, normalized)
+    return KEYBOARD_CODES.get(normalized)
+
+
+def _char_codes(char, layout):
+    """单个字符 -> 扫描码序列（大写字母与符号自动附加 Shift/AltGr）"""
+    strokes = char_strokes(char, layout)
+    if strokes is not None and len(strokes) == 1:
+        return strokes[0]
+    if strokes is not None:
+        raise UnknownKeyError(f"Key {char!r} needs a dead-key sequence in layout {layout!r}, use type_text()")
+    raise UnknownKeyError(f"Unknown key: {char!r}")
+
+
+def _physical_code(char, layout):
+    """
+    组合键中的单个字符 -> 印有该字符的物理按键，不附加该字符本身需要的 Shift/AltGr，
+    例如 AZERTY 下 'ctrl+1' 为 Ctrl + 数字 1 所在的键，而不是 Ctrl+Shift+1。
+    字母不区分大小写："Ctrl+T" 与 "ctrl+t" 相同。
+    """
+    for candidate in (char.lower(), char):
+        strokes = char_strokes(candidate, layout) or char_strokes(candidate)
+        if strokes:
+            return next(code for code in strokes[0] if code not in MODIFIER_CODES)
+    raise UnknownKeyError(f"Unknown key: {char!r}")
+
+
+def _chord_codes(name, layout):
+    modifiers = []
+    keys = []
+    for token in _split_chord(name):
+        token = token.strip() if len(token) > 1 else token
+        if not token:
+            raise UnknownKeyError(f"Unknown key: {name!r}")
+        if len(token) == 1:
+            codes = (_physical_code(token, layout),)
+        else:
+            code = _named_code(token)
+            if code is None:
+                raise UnknownKeyError(f"Unknown key {token!r} in {name!r}")
+            codes = (code,)
+        for code in codes:
+            target = modifiers if code in MODIFIER_CODES else keys
+            if code not in target:
+                target.append(code)
+    codes = tuple(modifiers + keys)
+    if len(codes) > MAX_KEYS:
+        raise UnknownKeyError(f"Too many keys in {name!r} (max {MAX_KEYS})")
+    return codes
+
+
+def _split_chord(name):
+    """按 '+' 拆分组合键，连续的 '++' 表示 '+' 键本身"""
+    parts = name.split('+')
+    tokens = []
+    i = 0
+    while i < len(parts):
+        if parts[i] == '' and i + 1 < len(parts) and parts[i + 1] == '':
+            tokens.append('+')
+            i += 2
+        else:
+            tokens.append(parts[i])
+            i += 1
+    return tokens
@@ -0,0 +1,120 @@
+"""
+键盘布局：把 Unicode 字符映射为按键序列 (strokes)。
+每个 stroke 是一组同时按下的扫描码，例如 AZERTY 下的 'ê' 为 ((0x2F,), (0x08,))：先按死键 '^' 再按 'e'。
+布局表在首次使用时编译为 {字符: strokes} 并缓存，之后每个字符只需一次字典查找。
+"""
+import unicodedata
+
+SHIFT = 0xE1
+ALTGR = 0xE6
+
+# 主键区各行的扫描码（按 ISO 键盘的物理位置排列）
+ROWS = (
+    (0x35, 0x1E, 0x1F, 0x20, 0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x2D, 0x2E),
+    (0x14, 0x1A, 0x08, 0x15, 0x17, 0x1C, 0x18, 0x0C, 0x12, 0x13, 0x2F, 0x30, 0x31),
+    (0x04, 0x16, 0x07, 0x09, 0x0A, 0x0B, 0x0D, 0x0E, 0x0F, 0x33, 0x34, 0x32),
+    (0x64, 0x1D, 0x1B, 0x06, 0x19, 0x05, 0x11, 0x10, 0x36, 0x37, 0x38),
+)
+
+# 所有布局共用的控制字符
+COMMON_CHARS = {' ': 0x2C, '\n': 0x28, '\r': 0x28, '\t': 0x2B, '\b': 0x2A, '\x1b': 0x29}
+
+# 死键字符 -> 组合附加符号
+_COMBINING = {'^': '\u0302', '¨': '\u0308', '´': '\u0301', '`': '\u0300', '~': '\u0303'}
+
+_BLANK = (' ' * 13, ' ' * 13, ' ' * 12, ' ' * 11)
+
+# 布局定义：每一层为四行字符串，与 ROWS 一一对应，空格表示该位置没有字符。
+# dead 为 (层, 扫描码) 集合，表示该位置是死键。
+LAYOUTS = {
+    'us': {
+        'base': ("`1234567890-=", "qwertyuiop[]\\", "asdfghjkl;' ", " zxcvbnm,./"),
+        'shift': ("~!@#$%^&*()_+", "QWERTYUIOP{}|", 'ASDFGHJKL:" ', " ZXCVBNM<>?"),
+        'altgr': _BLANK,
+        'dead': (),
+    },
+    'fr': {
+        'base': ("²&é\"'(-è_çà)=", "azertyuiop^$ ", "qsdfghjklmù*", "<wxcvbn,;:!"),
+        'shift': (" 1234567890°+", "AZERTYUIOP¨£ ", "QSDFGHJKLM%µ", ">WXCVBN?./§"),
+        'altgr': ("  ~#{[|`\\^@]}", "  €        ¤ ", _BLANK[2], _BLANK[3]),
+        'dead': (('base', 0x2F), ('shift', 0x2F), ('altgr', 0x1F), ('altgr', 0x24)),
+    },
+    'de': {
+        'base': ("^1234567890ß´", "qwertzuiopü+ ", "asdfghjklöä#", "<yxcvbnm,.-"),
+        'shift': ("°!\"§$%&/()=?`", "QWERTZUIOPÜ* ", "ASDFGHJKLÖÄ'", ">YXCVBNM;:_"),
+        'altgr': ("  ²³   {[]}\\ ", "@ €        ~ ", _BLANK[2], "|      µ   "),
+        'dead': (('base', 0x35), ('base', 0x2E), ('shift', 0x2E)),
+    },
+}
+
+LAYOUT_ALIASES = {'qwerty': 'us', 'azerty': 'fr', 'qwertz': 'de'}
+
+_MODIFIERS = {'base': (), 'shift': (SHIFT,), 'altgr': (ALTGR,)}
+
+_compiled = {}
+
+
+class UnknownLayoutError(ValueError):
+    """未注册的键盘布局"""
+
+
+def register_layout(name, base, shift, altgr=None, dead=()):
+    """
+    注册自定义布局。base/shift/altgr 各为四行字符串，长度需与 ROWS 对应。
+    """
+    LAYOUTS[name] = {'base': base, 'shift': shift, 'altgr': altgr or _BLANK, 'dead': tuple(dead)}
+    _compiled.pop(name, None)
+
+
+def get_layout(name='us'):
+    """返回编译后的布局表 {字符: strokes}"""
+    table = _compiled.get(name)
+    if table is None:
+        key = LAYOUT_ALIASES.get(name, name)
+        if key not in LAYOUTS:
+            raise UnknownLayoutError(f"Unknown keyboard layout: {name!r}")
+        table = _compiled.get(key)
+        if table is None:
+            table = _compile(key, LAYOUTS[key])
+            _compiled[key] = table
+        _compiled[name] = table
+    return table
+
+
+def char_strokes(char, layout='us'):
+    """返回输入单个字符所需的按键序列，无法输入时返回 None"""
+    return get_layout(layout).get(char)
+
+
+def _compile(name, spec):
+    table = {char: ((code,),) for char, code in COMMON_CHARS.items()}
+    dead_keys = {}
+    dead_positions = set(spec['dead'])
+    for level in ('base', 'shift', 'altgr'):
+        rows = spec[level]
+        if len(rows) != len(ROWS) or any(len(r) != len(c) for r, c in zip(rows, ROWS)):
+            raise ValueError(f"Layout {name!r}: level {level!r} does not match the key rows")
+        modifiers = _MODIFIERS[level]
+        for chars, codes in zip(rows, ROWS):
+            for char, code in zip(chars, codes):
+                if char == ' ':
+                    continue
+                stroke = modifiers + (code,)
+                if (level, code) in dead_positions:
+                    dead_keys.setdefault(char, stroke)
+                elif char not in table:
+                    table[char] = (stroke,)
+
+    # 死键：死键 + 字母组合出带附加符号的字符，死键 + 空格输入符号本身
+    space = (COMMON_CHARS[' '],)
+    letters = [c for c in table if c.isalpha() and len(table[c]) == 1]
+    for dead_char, dead_stroke in dead_keys.items():
+        combining = _COMBINING.get(dead_char)
+        if combining:
+            for letter in letters:
+                composed = unicodedata.normalize('NFC', letter + combining)
+                if len(composed) == 1 and composed not in table:
+                    table[composed] = (dead_stroke,) + table[letter]
+        if dead_char not in table:
+            table[dead_char] = (dead_stroke, space)
+    return table
@@ -2,12 +2,22 @@ import time
 from .protocol import build_mouse_packet
 
 class Mouse:
-    def __init__(self, transmitter):
+    def __init__(self, transmitter, resync_interval=None):
+        """
+        resync_interval: 按键状态未变化时也强制重发的最小间隔（秒），None 表示只在状态变化时发送。
+        """
         self.transmitter = transmitter
+        self.resync_interval = resync_interval
         self._button_mask = 0x00
+        self._last_report = None
+        self._last_sent_at = 0.0
 
     def move(self, x=0, y=0, wheel=0):
         """相对移动鼠标"""
+        if not (x or y or wheel):
+            # 无位移的移动包等价于一次状态包
+            self._send_status()
+            return
         packet = build_mouse_packet(self._button_mask, x, y, wheel)
         self.transmitter.send(packet)
 
@@ -19,17 +29,30 @@ class Mouse:
         time.sleep(delay)
         self.release(button)
 
-    def press(self, button='left'):
+    def press(self, button='left', force=False):
         """按下鼠标按键不松开"""
         mask = self._get_mask(button)
         self._button_mask |= mask
-        self._send_status()
+        self._send_status(force)
 
-    def release(self, button='left'):
+    def release(self, button='left', force=False):
         """松开鼠标按键"""
         mask = self._get_mask(button)
         self._button_mask &= ~mask
-        self._send_status()
+        self._send_status(force)
+
+    def release_all(self, force=False):
+        """松开所有鼠标按键"""
+        self._button_mask = 0x00
+        self._send_status(force)
+
+    def sync(self):
+        """无条件重发当前按键状态，用于纠正设备端可能丢失的状态"""
+        self._send_status(force=True)
+
+    def invalidate(self):
+        """丢弃已发送状态的记录（例如绕过本对象直接发送了数据包），下一次状态包必定发出"""
+        self._last_report = None
 
     def _get_mask(self, button):
         if button == 'left': return 0x01
@@ -37,6 +60,16 @@ class Mouse:
         if button == 'middle': return 0x04
         return 0x00
 
-    def _send_status(self):
+    def _send_status(self, force=False):
         packet = build_mouse_packet(self._button_mask, 0, 0, 0)
-        self.transmitter.send(packet)
+        now = time.monotonic()
+        if not force and packet == self._last_report:
+            # 与上一次发送的报文相同，设备端状态无需更新
+            if self.resync_interval is None or now - self._last_sent_at < self.resync_interval:
+                return
+        if self.transmitter.send(packet) is False:
+            # 发送失败时设备端状态未知，下一次状态包必须重新发出
+            self._last_report = None
+            return
+        self._last_report = packet
+        self._last_sent_at = now
@@ -1,29 +1,34 @@
-from .constants import KEYBOARD_CODES
-from .protocol import build_keyboard_packet, build_mouse_packet
+from .keys import resolve_key
+from .protocol import keyboard_report, mouse_report
 
 class KeyboardPacket:
     """
     用于构建单个键盘数据包。
     支持链式调用：packet.add_key('a').add_key('b')
+    build() 通过 keyboard_report 的缓存返回报文，相同的按键状态共用同一个 bytes 对象。
     """
+    __slots__ = ('keys',)
+
     def __init__(self):
         self.keys = []
 
     def add_key(self, key):
-        if key in KEYBOARD_CODES:
-            code = KEYBOARD_CODES[key]
+        for code in resolve_key(key).codes:
             if code not in self.keys and len(self.keys) < 6:
                 self.keys.append(code)
         return self
 
     def build(self):
-        return build_keyboard_packet(self.keys)
+        return keyboard_report(tuple(self.keys))
 
 
 class MousePacket:
     """
     用于构建单个鼠标数据包。
+    build() 通过 mouse_report 的缓存返回报文。
     """
+    __slots__ = ('button_mask', 'x', 'y', 'wheel')
+
     def __init__(self):
         self.button_mask = 0x00
         self.x = 0
@@ -43,4 +48,4 @@ class MousePacket:
         return self
 
     def build(self):
-        return build_mouse_packet(self.button_mask, self.x, self.y, self.wheel)
+        return mouse_report(self.button_mask & 0xFF, self.x & 0xFF, self.y & 0xFF, self.wheel & 0xFF)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 def build_packet(header=None, addr=0x00, cmd=0x00, data=None):
     """
     Builds a packet according to the custom protocol.
@@ -13,23 +15,41 @@ def build_packet(header=None, addr=0x00, cmd=0x00, data=None):
     # Calculate checksum: sum(header + addr + cmd + len + data) % 256
     checksum = (sum(header) + addr + cmd + data_length + sum(data)) % 256
     
-    packet = (
-        bytes(header) + 
-        bytes([addr, cmd, data_length]) + 
-        bytes(data) + 
-        bytes([checksum])
-    )
+    packet = bytes([*header, addr, cmd, data_length, *data, checksum])
     return packet
 
+@lru_cache(maxsize=1024)
+def keyboard_report(scancodes):
+    """
+    Cached variant of build_keyboard_packet() keyed by a tuple of scancodes.
+    Identical key states (all released, single key downs, ...) return the same bytes object.
+    """
+    # Pad to 8 bytes if needed
+    padded_data = [0x00] * (8 - len(scancodes)) + list(scancodes)
+    return build_packet(cmd=0x02, data=padded_data)
+
+@lru_cache(maxsize=4096)
+def mouse_report(button_mask, x_rel, y_rel, wheel):
+    """
+    Cached variant of build_mouse_packet(). Arguments must already be reduced to 0-255.
+    Clicks, releases and unit moves return the same bytes object on every call.
+    """
+    data = [
+        0x01,                   # Relative mode
+        button_mask,
+        x_rel,
+        y_rel,
+        wheel
+    ]
+    return build_packet(cmd=0x05, data=data)
+
 def build_keyboard_packet(scancodes):
     """
     Builds a keyboard command packet (Cmd 0x02).
     Expects a list of up to 6 scancodes (plus potential modifiers if handled by protocol).
     In this implementation, it seems to expect 8 bytes of data.
     """
-    # Pad to 8 bytes if needed
-    padded_data = [0x00] * (8 - len(scancodes)) + scancodes
-    return build_packet(cmd=0x02, data=padded_data)
+    return keyboard_report(tuple(scancodes))
 
 def build_mouse_packet(button_mask, x_rel, y_rel, wheel):
     """
@@ -37,11 +57,4 @@ def build_mouse_packet(button_mask, x_rel, y_rel, wheel):
     Data Format (5 bytes):
     [0x01 (Mode)] [Buttons] [X] [Y] [Wheel]
     """
-    data = [
-        0x01,                   # Relative mode
-        button_mask & 0xFF,
-        x_rel & 0xFF,
-        y_rel & 0xFF,
-        wheel & 0xFF
-    ]
-    return build_packet(cmd=0x05, data=data)
+    return mouse_report(button_mask & 0xFF, x_rel & 0xFF, y_rel & 0xFF, wheel & 0xFF)
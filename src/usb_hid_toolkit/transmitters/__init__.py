@@ -1,2 +1,20 @@
-from .base import BaseTransmitter
-from .tcp import TCPTransmitter
+__all__ = ['BaseTransmitter', 'TCPTransmitter']
+
+# 传输层按需加载，避免导入未使用的依赖（socket、串口、asyncio 等）
+_LAZY_ATTRS = {
+    'BaseTransmitter': 'base',
+    'TCPTransmitter': 'tcp',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(__import__(module, globals(), level=1, fromlist=[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
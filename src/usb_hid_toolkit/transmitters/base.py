@@ -3,6 +3,7 @@ from abc import ABC, abstractmethod
 class BaseTransmitter(ABC):
     @abstractmethod
     def send(self, packet: bytes):
+        """Sends a packet; returns False if it could not be delivered."""
         pass
 
     @abstractmethod
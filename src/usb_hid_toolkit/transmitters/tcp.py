@@ -12,14 +12,17 @@ class TCPTransmitter(BaseTransmitter):
         Sends a packet over TCP.
         Note: The original implementation creates a new socket for each send.
         We'll follow that pattern but could optimize if needed.
+        Returns True on success and False if the packet could not be sent.
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(self.timeout)
         try:
             sock.connect((self.host, self.port))
             sock.sendall(packet)
+            return True
         except Exception as e:
             print(f"TCP Send Error: {e}")
+            return False
         finally:
             sock.close()
 